@@ -82,6 +82,26 @@ CREATE TABLE tracker (
 	CONSTRAINT tracker_owner_id_name_unique UNIQUE (owner_id, name)
 );
 
+CREATE TABLE tracker_ticket_stats (
+	tracker_id integer PRIMARY KEY REFERENCES tracker(id) ON DELETE CASCADE,
+	ticket_version integer DEFAULT 0 NOT NULL,
+	removed_version integer DEFAULT 0 NOT NULL,
+	open_ticket_count integer DEFAULT 0 NOT NULL,
+	closed_ticket_count integer DEFAULT 0 NOT NULL,
+	updated timestamp without time zone
+);
+
+CREATE FUNCTION create_tracker_ticket_stats() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO tracker_ticket_stats (tracker_id) VALUES (NEW.id);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tracker_ticket_stats
+	AFTER INSERT ON tracker
+	FOR EACH ROW EXECUTE PROCEDURE create_tracker_ticket_stats();
+
 CREATE TABLE user_access (
 	id serial PRIMARY KEY,
 	tracker_id integer NOT NULL REFERENCES tracker(id) ON DELETE CASCADE,
@@ -91,6 +111,8 @@ CREATE TABLE user_access (
 	CONSTRAINT idx_useraccess_tracker_user_unique UNIQUE (tracker_id, user_id)
 );
 
+CREATE INDEX user_access_user_id ON user_access USING btree (user_id);
+
 CREATE TABLE label (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -99,6 +121,7 @@ CREATE TABLE label (
 	name text NOT NULL,
 	color text NOT NULL,
 	text_color text NOT NULL,
+	ticket_count integer DEFAULT 0 NOT NULL,
 	CONSTRAINT idx_tracker_name_unique UNIQUE (tracker_id, name)
 );
 
@@ -116,6 +139,7 @@ CREATE TABLE ticket (
 	submitter_id integer NOT NULL REFERENCES participant(id) ON DELETE CASCADE,
 	authenticity integer DEFAULT 0 NOT NULL,
 	comment_count integer DEFAULT 0 NOT NULL,
+	tracker_version integer DEFAULT 0 NOT NULL,
 	CONSTRAINT uq_ticket_scoped_id_tracker_id UNIQUE (scoped_id, tracker_id),
 	CONSTRAINT uq_ticket_tracker_id_scoped_id UNIQUE (tracker_id, scoped_id)
 );
@@ -130,6 +154,20 @@ CREATE INDEX ticket_tracker_id ON ticket USING btree (tracker_id);
 
 CREATE INDEX ticket_dupe_of_id ON ticket USING btree (dupe_of_id);
 
+CREATE INDEX ticket_submitter_id ON ticket USING btree (submitter_id);
+
+CREATE INDEX ticket_tracker_id_status_updated ON ticket USING btree (tracker_id, status, updated);
+
+CREATE INDEX ticket_open_tracker_id_updated ON ticket USING btree (tracker_id, updated) WHERE status != 8;
+
+CREATE INDEX ticket_open_tracker_id_created ON ticket USING btree (tracker_id, created) WHERE status != 8;
+
+CREATE INDEX ticket_open_tracker_id_comment_count ON ticket USING btree (tracker_id, comment_count) WHERE status != 8;
+
+CREATE INDEX ticket_open_updated ON ticket USING btree (updated) WHERE status != 8;
+
+CREATE INDEX ticket_tracker_id_tracker_version ON ticket USING btree (tracker_id, tracker_version);
+
 CREATE TABLE ticket_assignee (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -142,6 +180,8 @@ CREATE TABLE ticket_assignee (
 
 CREATE INDEX ticket_assignee_ticket_id ON ticket_assignee USING btree (ticket_id);
 
+CREATE INDEX ticket_assignee_assignee_id ON ticket_assignee USING btree (assignee_id);
+
 CREATE TABLE ticket_comment (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -169,6 +209,138 @@ CREATE TABLE ticket_label (
 
 CREATE INDEX ticket_label_ticket_id ON ticket_label USING btree (ticket_id);
 
+-- Keeps tracker_ticket_stats current, and stamps written tickets with the new
+-- ticket_version. Runs when the transaction commits, so that ticket writes do
+-- not hold a lock on their tracker's stats for the rest of the transaction.
+-- removed_version records the last ticket deleted from or moved out of the
+-- tracker. Tickets are closed when their status is resolved (8).
+CREATE FUNCTION update_tracker_ticket_stats() RETURNS trigger AS $$
+DECLARE
+	old_open integer := 0;
+	old_closed integer := 0;
+	new_version integer;
+BEGIN
+	IF TG_OP = 'UPDATE' AND OLD.tracker_id = NEW.tracker_id THEN
+		old_open := (OLD.status != 8)::integer;
+		old_closed := (OLD.status = 8)::integer;
+	ELSIF TG_OP IN ('UPDATE', 'DELETE') THEN
+		UPDATE tracker_ticket_stats SET
+			ticket_version = ticket_version + 1,
+			removed_version = ticket_version + 1,
+			open_ticket_count = open_ticket_count - (OLD.status != 8)::integer,
+			closed_ticket_count = closed_ticket_count - (OLD.status = 8)::integer,
+			updated = now() AT TIME ZONE 'UTC'
+		WHERE tracker_id = OLD.tracker_id;
+	END IF;
+	IF TG_OP = 'DELETE' THEN
+		RETURN NULL;
+	END IF;
+	UPDATE tracker_ticket_stats SET
+		ticket_version = ticket_version + 1,
+		open_ticket_count = open_ticket_count + (NEW.status != 8)::integer - old_open,
+		closed_ticket_count = closed_ticket_count + (NEW.status = 8)::integer - old_closed,
+		updated = now() AT TIME ZONE 'UTC'
+	WHERE tracker_id = NEW.tracker_id
+	RETURNING ticket_version INTO new_version;
+	UPDATE ticket SET tracker_version = new_version WHERE id = NEW.id;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER ticket_insert_delete_tracker_stats
+	AFTER INSERT OR DELETE ON ticket
+	DEFERRABLE INITIALLY DEFERRED
+	FOR EACH ROW EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+-- Stamping a ticket changes its tracker_version, which is not counted as a
+-- write. touch_ticket_version sets it to 0 to count as one.
+CREATE CONSTRAINT TRIGGER ticket_update_tracker_stats
+	AFTER UPDATE ON ticket
+	DEFERRABLE INITIALLY DEFERRED
+	FOR EACH ROW
+	WHEN (NEW.tracker_version = OLD.tracker_version
+		OR NEW.tracker_version = 0)
+	EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+-- Keeps label.ticket_count current
+CREATE FUNCTION update_label_ticket_count() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		UPDATE label SET ticket_count = ticket_count + 1
+		WHERE id = NEW.label_id;
+	ELSE
+		UPDATE label SET ticket_count = ticket_count - 1
+		WHERE id = OLD.label_id;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ticket_label_label_count
+	AFTER INSERT OR DELETE ON ticket_label
+	FOR EACH ROW EXECUTE PROCEDURE update_label_ticket_count();
+
+-- Counts label and assignee changes as writes to their ticket. The version set
+-- here is replaced by ticket_update_tracker_stats.
+CREATE FUNCTION touch_ticket_version() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		UPDATE ticket SET tracker_version = 0 WHERE id = NEW.ticket_id;
+	ELSE
+		UPDATE ticket SET tracker_version = 0 WHERE id = OLD.ticket_id;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ticket_label_ticket_version
+	AFTER INSERT OR DELETE ON ticket_label
+	FOR EACH ROW EXECUTE PROCEDURE touch_ticket_version();
+
+CREATE TRIGGER ticket_assignee_ticket_version
+	AFTER INSERT OR DELETE ON ticket_assignee
+	FOR EACH ROW EXECUTE PROCEDURE touch_ticket_version();
+
+-- Renaming a label changes which tickets searches for it match, so its tickets
+-- count as written as well
+CREATE FUNCTION bump_tracker_label_version() RETURNS trigger AS $$
+BEGIN
+	UPDATE tracker_ticket_stats SET ticket_version = ticket_version + 1
+	WHERE tracker_id = NEW.tracker_id;
+	UPDATE ticket SET tracker_version = 0
+	WHERE id IN (SELECT ticket_id FROM ticket_label WHERE label_id = NEW.id);
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER label_tracker_version
+	AFTER UPDATE OF name ON label
+	FOR EACH ROW
+	WHEN (OLD.name != NEW.name)
+	EXECUTE PROCEDURE bump_tracker_label_version();
+
+CREATE TABLE saved_search (
+	id serial PRIMARY KEY,
+	created timestamp without time zone NOT NULL,
+	updated timestamp without time zone NOT NULL,
+	user_id integer NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+	tracker_id integer NOT NULL REFERENCES tracker(id) ON DELETE CASCADE,
+	name character varying(128) NOT NULL,
+	search character varying(2048) NOT NULL,
+	tracker_version integer,
+	CONSTRAINT uq_saved_search_user_id_tracker_id_name
+		UNIQUE (user_id, tracker_id, name)
+);
+
+CREATE TABLE saved_search_ticket (
+	saved_search_id integer NOT NULL
+		REFERENCES saved_search(id) ON DELETE CASCADE,
+	ticket_id integer NOT NULL REFERENCES ticket(id) ON DELETE CASCADE,
+	PRIMARY KEY (saved_search_id, ticket_id)
+);
+
+CREATE INDEX saved_search_ticket_ticket_id ON saved_search_ticket USING btree (ticket_id);
+
 CREATE TABLE ticket_subscription (
 	id serial PRIMARY KEY,
 	created timestamp without time zone NOT NULL,
@@ -215,6 +387,10 @@ CREATE TABLE event_notification (
 
 CREATE INDEX event_notification_event_id ON event_notification USING btree (event_id);
 
+CREATE INDEX event_notification_user_id_created ON event_notification USING btree (user_id, created DESC, event_id);
+
+CREATE INDEX event_notification_created ON event_notification USING btree (created);
+
 -- GraphQL webhooks
 CREATE TABLE gql_user_wh_sub (
 	id serial PRIMARY KEY,
@@ -283,6 +459,8 @@ CREATE TABLE gql_tracker_wh_sub (
 
 CREATE INDEX gql_tracker_wh_sub_token_hash_idx ON gql_tracker_wh_sub USING btree (token_hash);
 
+CREATE INDEX gql_tracker_wh_sub_tracker_id_idx ON gql_tracker_wh_sub USING btree (tracker_id);
+
 CREATE TABLE gql_tracker_wh_delivery (
 	id serial PRIMARY KEY,
 	uuid uuid NOT NULL,
@@ -325,6 +503,8 @@ CREATE TABLE gql_ticket_wh_sub (
 
 CREATE INDEX gql_ticket_wh_sub_token_hash_idx ON gql_ticket_wh_sub USING btree (token_hash);
 
+CREATE INDEX gql_ticket_wh_sub_ticket_id_idx ON gql_ticket_wh_sub USING btree (ticket_id);
+
 CREATE TABLE gql_ticket_wh_delivery (
 	id serial PRIMARY KEY,
 	uuid uuid NOT NULL,
@@ -383,6 +563,8 @@ CREATE TABLE tracker_webhook_subscription (
 	tracker_id integer NOT NULL REFERENCES tracker(id) ON DELETE CASCADE
 );
 
+CREATE INDEX tracker_webhook_subscription_tracker_id ON tracker_webhook_subscription USING btree (tracker_id);
+
 CREATE TABLE tracker_webhook_delivery (
 	id serial PRIMARY KEY,
 	uuid uuid NOT NULL,
@@ -50,5 +50,7 @@ setup(
       'todosrht-initdb',
       'todosrht-lmtp',
       'todosrht-migrate',
+      'todosrht-periodic',
+      'todosrht-reconcile',
   ]
 )
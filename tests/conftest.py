@@ -1,4 +1,5 @@
 import pytest
+import sqlalchemy as sa
 from srht.database import DbSession
 from todosrht.flask import TodoApp
 from collections import namedtuple
@@ -45,3 +46,36 @@ def no_emails(monkeypatch):
     """Discards all emails sent by tested code."""
     monkeypatch.setattr('todosrht.email.send_email', lambda *a, **k: None)
     monkeypatch.setattr('todosrht.email.lookup_key', lambda *a, **k: None)
+
+@pytest.fixture()
+def webhook_tasks(monkeypatch):
+    """
+    Records webhook delivery tasks instead of queueing them, along with
+    whether every change made so far was committed when they were queued.
+    The webhook routing table is kept in a dict instead of Redis.
+    """
+    from todosrht import webhooks
+    tasks = []
+    flushed = []
+    def after_flush(session, context):
+        flushed.append(session)
+    def after_end(session):
+        flushed.clear()
+    listeners = [("after_flush", after_flush), ("after_commit", after_end),
+            ("after_rollback", after_end)]
+    for identifier, fn in listeners:
+        sa.event.listen(sa.orm.Session, identifier, fn)
+
+    def delay(webhook, sub_id, events):
+        session = db.session
+        pending = session.new or session.dirty or session.deleted
+        tasks.append((webhook, sub_id, events, not flushed and not pending))
+    monkeypatch.setattr(webhooks.deliver_batch, "delay", delay)
+
+    cache = {}
+    monkeypatch.setattr(webhooks, "get_cache", cache.get)
+    monkeypatch.setattr(webhooks, "set_cache",
+            lambda key, ttl, value: cache.__setitem__(key, value))
+    yield tasks
+    for identifier, fn in listeners:
+        sa.event.remove(sa.orm.Session, identifier, fn)
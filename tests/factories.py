@@ -2,7 +2,8 @@ import factory
 from datetime import datetime, timedelta
 from factory.fuzzy import FuzzyText
 from srht.database import db
-from todosrht.types import Tracker, User, Ticket, Participant, ParticipantType
+from todosrht.types import Tracker, TrackerTicketStats, User, Ticket
+from todosrht.types import Participant, ParticipantType
 from todosrht.types import Label, TicketLabel, TicketAssignee, TicketComment
 
 future_datetime = datetime.now() + timedelta(days=10)
@@ -30,10 +31,19 @@ class ParticipantFactory(factory.alchemy.SQLAlchemyModelFactory):
         sqlalchemy_session = db.session
 
 
+class TrackerTicketStatsFactory(factory.alchemy.SQLAlchemyModelFactory):
+    class Meta:
+        model = TrackerTicketStats
+        sqlalchemy_session = db.session
+
+
 class TrackerFactory(factory.alchemy.SQLAlchemyModelFactory):
     owner = factory.SubFactory(UserFactory)
     name = factory.Sequence(lambda n: f"tracker{n}")
     import_in_progress = False
+    # Created by a database trigger in production
+    stats = factory.RelatedFactory(TrackerTicketStatsFactory,
+            factory_related_name="tracker")
 
     class Meta:
         model = Tracker
@@ -1,5 +1,6 @@
 from srht.database import db
 from todosrht.tickets import assign, unassign
+from todosrht.types import EventType
 
 from .factories import UserFactory, TrackerFactory, TicketFactory
 
@@ -16,9 +17,10 @@ def test_assignment(mailbox):
 
     assert ticket.assigned_users == []
 
-    assign(ticket, assignee1, assigner)
+    event = assign(ticket, assignee1, assigner)
     db.session.commit()
     assert set(ticket.assigned_users) == {assignee1}
+    assert event.event_type == EventType.assigned_user
 
     assert len(mailbox) == 1
     assert mailbox[0].to == assignee1.email
@@ -30,7 +32,7 @@ def test_assignment(mailbox):
     )
 
     # Assignment is idempotent
-    assign(ticket, assignee1, assigner)
+    assert assign(ticket, assignee1, assigner) is None
     db.session.commit()
     assert set(ticket.assigned_users) == {assignee1}
 
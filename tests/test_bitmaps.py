@@ -0,0 +1,131 @@
+import pytest
+
+from tests import factories as f
+from todosrht.bitmaps import TrackerIndex
+from todosrht.search import apply_search, resolve_facets, search_facets
+from todosrht.types import Ticket, TicketStatus
+from srht.database import db
+
+
+def test_bitmap_search(client):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner)
+
+    luke = f.ParticipantFactory(user=f.UserFactory(username="luke"))
+    leia = f.ParticipantFactory(user=f.UserFactory(username="leia"))
+
+    ticket1 = f.TicketFactory(tracker=tracker, submitter=luke)
+    ticket2 = f.TicketFactory(tracker=tracker, submitter=luke)
+    ticket3 = f.TicketFactory(tracker=tracker, submitter=leia,
+            status=TicketStatus.confirmed)
+    ticket4 = f.TicketFactory(tracker=tracker, submitter=leia,
+            status=TicketStatus.resolved)
+    f.TicketFactory(submitter=leia)  # on another tracker
+
+    f.TicketAssigneeFactory(ticket=ticket1, assignee=luke.user, assigner=owner)
+    f.TicketAssigneeFactory(ticket=ticket3, assignee=leia.user, assigner=owner)
+
+    jedi = f.LabelFactory(tracker=tracker, name="jedi")
+    sith = f.LabelFactory(tracker=tracker, name="sith")
+    f.TicketLabelFactory(user=owner, ticket=ticket1, label=jedi)
+    f.TicketLabelFactory(user=owner, ticket=ticket2, label=sith)
+    f.TicketLabelFactory(user=owner, ticket=ticket4, label=jedi)
+    db.session.commit()
+
+    index = TrackerIndex(tracker.id)
+    index.load()
+    index.version = 0
+
+    query = Ticket.query.filter(Ticket.tracker_id == tracker.id)
+
+    def check(search_string, user=owner):
+        results = apply_search(query, search_string, user)
+        expected = [t.id for t in results]
+        ids = index.search(search_string, user)
+        assert ids == expected, search_string
+        facets = resolve_facets(index.facet_counts(ids))
+        assert facets == search_facets(results), search_string
+
+    searches = [
+        "",
+        "status:any",
+        "status:closed",
+        "status:confirmed",
+        "!status:open",
+        "label:jedi",
+        "!label:jedi",
+        "label:jedi label:sith",
+        "label:nope",
+        "no:label",
+        "no:assignee",
+        "!no:assignee status:any",
+        "submitter:luke",
+        "!submitter:leia status:any",
+        "assigned:leia",
+        "assigned:me",
+        "label:jedi status:any sort:created",
+        "status:any rsort:created",
+        "status:any sort:comments rsort:created",
+    ]
+    for search_string in searches:
+        check(search_string)
+    check("assigned:me", luke.user)
+    # The same for anonymous users, for whom "me" matches nobody
+    for search_string in ["submitter:me", "assigned:me", "!assigned:me"]:
+        check(search_string, None)
+
+    # Terms which need SQL are left to apply_search
+    assert index.search("jedi", owner) is None
+    assert index.search("status:foo", owner) is None
+    assert index.search("sort:foo", owner) is None
+
+    with pytest.raises(ValueError) as excinfo:
+        index.search("submitter:yoda", owner)
+    assert "Unknown user: 'yoda'" == str(excinfo.value)
+
+    # Tickets written since the index was loaded are updated in place. The
+    # tracker version is normally set by a database trigger.
+    f.TicketLabelFactory(user=owner, ticket=ticket3, label=sith)
+    ticket1.status = TicketStatus.resolved
+    ticket3.tracker_version = 1
+    ticket1.tracker_version = 1
+    ticket5 = f.TicketFactory(tracker=tracker, submitter=luke,
+            tracker_version=1)
+    db.session.commit()
+
+    index.update()
+    assert ticket5.id in index.rows
+    for search_string in searches:
+        check(search_string)
+
+def test_bitmap_refresh(client):
+    tracker = f.TrackerFactory()
+    ticket1 = f.TicketFactory(tracker=tracker)
+    ticket2 = f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    index = TrackerIndex(tracker.id)
+    index.refresh(tracker)
+    assert set(index.rows) == {ticket1.id, ticket2.id}
+
+    # A ticket replaced by another keeps the ticket count the same. The
+    # versions are normally set by database triggers.
+    db.session.delete(ticket2)
+    ticket3 = f.TicketFactory(tracker=tracker, tracker_version=2)
+    tracker.stats.ticket_version = 2
+    tracker.stats.removed_version = 1
+    db.session.commit()
+
+    index.refresh(tracker)
+    assert set(index.rows) == {ticket1.id, ticket3.id}
+    assert set(index.search("status:any", None)) == {ticket1.id, ticket3.id}
+
+    # Without removals, only the tickets written since are loaded
+    ticket1.status = TicketStatus.resolved
+    ticket1.tracker_version = 3
+    tracker.stats.ticket_version = 3
+    db.session.commit()
+
+    index.refresh(tracker)
+    assert index.search("status:closed", None) == [ticket1.id]
+    assert index.search("status:open", None) == [ticket3.id]
@@ -0,0 +1,141 @@
+import json
+from srht.database import db
+from tests import factories as f
+from tests.utils import api_request
+from todosrht.blueprints.api import tickets as api_tickets
+from todosrht.blueprints.api.tickets import tracker_tickets_bulk_POST
+from todosrht.types import Event, EventType, TicketResolution, TicketStatus
+from todosrht.types import Visibility
+from todosrht.webhooks import TrackerWebhook
+
+
+def bulk(tracker, user, body):
+    response = api_request(tracker_tickets_bulk_POST, user,
+            method="POST", json=body,
+            username=f"~{tracker.owner.username}", tracker_name=tracker.name)
+    return response.status_code, json.loads(response.get_data())
+
+def test_bulk_validation(client, webhook_tasks):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    f.LabelFactory(tracker=tracker, name="bug")
+    ticket = f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    def error(body):
+        status, result = bulk(tracker, owner, body)
+        assert status == 400
+        return [(e.get("field"), e["reason"]) for e in result["errors"]]
+
+    ids = [ticket.scoped_id]
+    assert error({"operation": "close", "tickets": ids})[0][0] == "operation"
+    assert error({"operation": "reopen"})
+    assert error({"operation": "reopen", "tickets": ids, "search": ""})
+    assert error({"operation": "reopen", "tickets": ["1"]}) == [
+        ("tickets", "Expected array of ticket IDs")]
+    assert error({"operation": "resolve", "tickets": ids})[0][0] == \
+        "resolution"
+    assert error({"operation": "label", "tickets": ids,
+        "labels": ["bug", "nope"]}) == [("labels", "Unknown label nope")]
+    assert error({"operation": "assign", "tickets": ids,
+        "assignee": "~nobody"}) == [("assignee", "Unknown user ~nobody")]
+
+    # Nothing was changed by the rejected requests
+    assert Event.query.filter(Event.ticket_id == ticket.id).count() == 0
+    assert ticket.status == TicketStatus.reported
+    assert webhook_tasks == []
+
+def test_bulk_resolve(client, no_emails, webhook_tasks):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    ticket1 = f.TicketFactory(tracker=tracker)
+    ticket2 = f.TicketFactory(tracker=tracker)
+    fixed = f.TicketFactory(tracker=tracker, status=TicketStatus.resolved,
+            resolution=TicketResolution.fixed)
+    other = f.TicketFactory()
+    db.session.commit()
+
+    # Tickets of other trackers and unknown IDs are not matched, and tickets
+    # already in the requested state are matched but not changed
+    status, result = bulk(tracker, owner, {
+        "operation": "resolve",
+        "resolution": "fixed",
+        "tickets": [ticket1.scoped_id, ticket2.scoped_id, fixed.scoped_id,
+            other.scoped_id, 100000],
+    })
+    assert status == 200
+    assert result == {
+        "operation": "resolve",
+        "matched": 3,
+        "changed": 2,
+        "tickets": sorted([ticket1.scoped_id, ticket2.scoped_id]),
+    }
+    for ticket in [ticket1, ticket2]:
+        assert ticket.status == TicketStatus.resolved
+        assert ticket.resolution == TicketResolution.fixed
+        [event] = Event.query.filter(Event.ticket_id == ticket.id).all()
+        assert event.event_type == EventType.status_change
+    assert Event.query.filter(Event.ticket_id == fixed.id).count() == 0
+    assert other.status == TicketStatus.reported
+
+    status, result = bulk(tracker, owner, {
+        "operation": "reopen",
+        "search": "status:closed",
+    })
+    assert status == 200
+    assert (result["matched"], result["changed"]) == (3, 3)
+    for ticket in [ticket1, ticket2, fixed]:
+        assert ticket.status == TicketStatus.reported
+
+def test_bulk_assign(client, no_emails, webhook_tasks):
+    owner = f.UserFactory()
+    assignee = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    assigned = f.TicketFactory(tracker=tracker)
+    f.TicketAssigneeFactory(ticket=assigned, assignee=assignee,
+            assigner=owner)
+    ticket = f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    status, result = bulk(tracker, owner, {
+        "operation": "assign",
+        "assignee": f"~{assignee.username}",
+        "tickets": [assigned.scoped_id, ticket.scoped_id],
+    })
+    assert status == 200
+    assert (result["matched"], result["changed"]) == (2, 1)
+    assert result["tickets"] == [ticket.scoped_id]
+    assert ticket.assigned_users == [assignee]
+    assert assigned.assigned_users == [assignee]
+    [event] = Event.query.filter(Event.ticket_id == ticket.id).all()
+    assert event.event_type == EventType.assigned_user
+
+def test_bulk_webhooks(client, no_emails, webhook_tasks, monkeypatch):
+    monkeypatch.setattr(api_tickets, "bulk_batch_size", 2)
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    tickets = [f.TicketFactory(tracker=tracker) for _ in range(3)]
+    sub = TrackerWebhook.Subscription(url="https://example.org/webhook",
+            tracker_id=tracker.id)
+    sub.events = [TrackerWebhook.Events.event_create]
+    db.session.add(sub)
+    db.session.commit()
+
+    status, result = bulk(tracker, owner, {
+        "operation": "resolve",
+        "resolution": "fixed",
+        "tickets": [t.scoped_id for t in tickets],
+    })
+    assert status == 200
+    assert result["changed"] == 3
+
+    # Each batch delivers its own events once it is committed
+    assert [len(events) for _, _, events, _ in webhook_tasks] == [2, 1]
+    payloads = list()
+    for webhook, sub_id, events, committed in webhook_tasks:
+        assert (webhook, sub_id) == ("TrackerWebhook", sub.id)
+        assert committed
+        payloads += [json.loads(payload) for event, payload in events]
+    assert [p["ticket"]["id"] for p in payloads] == \
+        [t.scoped_id for t in tickets]
+    assert all(p["event_type"] == ["status_change"] for p in payloads)
@@ -75,6 +75,7 @@ def test_ticket_comment(mailbox):
     assert ticket.status == TicketStatus.reported
     assert ticket.resolution == TicketResolution.unresolved
     assert len(ticket.comments) == 1
+    assert ticket.comment_count == 1
     assert len(ticket.events) == 1
 
     assert event.ticket == ticket
@@ -95,6 +96,7 @@ def test_ticket_comment(mailbox):
     assert ticket.status == TicketStatus.resolved
     assert ticket.resolution == TicketResolution.fixed
     assert len(ticket.comments) == 2
+    assert ticket.comment_count == 2
     assert len(ticket.events) == 2
 
     assert event.ticket == ticket
@@ -119,6 +121,7 @@ def test_ticket_comment(mailbox):
     assert ticket.status == TicketStatus.reported
     assert ticket.resolution == TicketResolution.fixed
     assert len(ticket.comments) == 3
+    assert ticket.comment_count == 3
     assert len(ticket.events) == 3
 
     assert event.ticket == ticket
@@ -149,6 +152,7 @@ def test_ticket_comment(mailbox):
     assert ticket.status == TicketStatus.reported
     assert ticket.resolution == TicketResolution.wont_fix
     assert len(ticket.comments) == 3
+    assert ticket.comment_count == 3
     assert len(ticket.events) == 5
 
     assert event.ticket == ticket
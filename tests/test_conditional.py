@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from srht.database import db
+from tests import factories as f
+from todosrht.conditional import make_etag, not_modified, tracker_state
+
+def test_not_modified(app):
+    updated = datetime(2020, 1, 1, 12, 0, 0, 123)
+    etag = make_etag(1, updated)
+    assert etag == make_etag(1, updated)
+    assert etag != make_etag(2, updated)
+
+    with app.test_request_context():
+        assert not_modified(etag, updated) is None
+
+    with app.test_request_context(headers={"If-None-Match": f'W/"{etag}"'}):
+        response = not_modified(etag, updated)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'W/"{etag}"'
+
+    with app.test_request_context(headers={"If-None-Match": '"stale"'}):
+        assert not_modified(etag, updated) is None
+
+    since = "Wed, 01 Jan 2020 12:00:00 GMT"
+    with app.test_request_context(headers={"If-Modified-Since": since}):
+        assert not_modified(etag, updated).status_code == 304
+
+    since = "Wed, 01 Jan 2020 11:59:59 GMT"
+    with app.test_request_context(headers={"If-Modified-Since": since}):
+        assert not_modified(etag, updated) is None
+
+def test_tracker_state(client):
+    tracker = f.TrackerFactory()
+    db.session.commit()
+
+    state, updated = tracker_state(tracker)
+    assert updated == tracker.updated
+    without_tickets, _ = tracker_state(tracker, tickets=False)
+
+    # Ticket writes are seen through the stats maintained by triggers
+    tracker.stats.ticket_version += 1
+    tracker.stats.updated = tracker.updated + timedelta(minutes=1)
+    db.session.commit()
+
+    new_state, new_updated = tracker_state(tracker)
+    assert new_state != state
+    assert new_updated == tracker.stats.updated
+    assert tracker_state(tracker, tickets=False) == (without_tickets, updated)
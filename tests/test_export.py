@@ -0,0 +1,77 @@
+import gzip
+import json
+import sqlalchemy as sa
+from srht.database import db
+from tests import factories as f
+from tests.utils import api_request
+from todosrht.blueprints.api import tickets as api_tickets
+from todosrht.blueprints.api.tickets import tracker_tickets_export_GET
+from todosrht.types import Visibility
+
+
+def export(tracker, headers=None):
+    return api_request(tracker_tickets_export_GET, tracker.owner,
+            headers=headers, username=f"~{tracker.owner.username}",
+            tracker_name=tracker.name)
+
+def make_tracker(ticket_count):
+    tracker = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    bug = f.LabelFactory(tracker=tracker, name="bug")
+    tickets = list()
+    for _ in range(ticket_count):
+        ticket = f.TicketFactory(tracker=tracker)
+        f.TicketLabelFactory(ticket=ticket, label=bug)
+        f.TicketAssigneeFactory(ticket=ticket)
+        tickets.append(ticket)
+    db.session.commit()
+    return tracker, tickets
+
+def test_export_tickets(client, monkeypatch):
+    monkeypatch.setattr(api_tickets, "export_batch_size", 2)
+    tracker, tickets = make_tracker(5)
+    other, _ = make_tracker(1)
+
+    response = export(tracker)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "Content-Encoding" not in response.headers
+    body = response.get_data()
+    assert body.endswith(b"\n")
+
+    # One line per ticket of the tracker, in order, across several batches
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert [t["id"] for t in lines] == [t.scoped_id for t in tickets]
+    for line, ticket in zip(lines, tickets):
+        assert line["labels"] == ["bug"]
+        [assignee] = ticket.assigned_users
+        assert [a["canonical_name"] for a in line["assignees"]] == \
+            [assignee.canonical_name]
+
+    # Compressed for clients which accept it
+    response = export(tracker, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == body
+
+def test_export_eager_loads(client):
+    small, _ = make_tracker(2)
+    large, _ = make_tracker(6)
+    db.session.expire_all()
+
+    def count_queries(tracker):
+        queries = list()
+        def before_cursor_execute(conn, cursor, statement, *args):
+            queries.append(statement)
+        sa.event.listen(sa.engine.Engine,
+                "before_cursor_execute", before_cursor_execute)
+        try:
+            response = export(tracker)
+        finally:
+            sa.event.remove(sa.engine.Engine,
+                    "before_cursor_execute", before_cursor_execute)
+        assert response.status_code == 200
+        db.session.expire_all()
+        return len(queries)
+
+    # Nothing the tickets serialize is loaded one ticket at a time
+    assert count_queries(large) == count_queries(small)
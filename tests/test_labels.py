@@ -0,0 +1,105 @@
+import json
+from srht.database import db
+from tests import factories as f
+from tests.utils import api_request
+from todosrht.blueprints.api.tickets import tracker_ticket_by_id_PUT
+from todosrht.blueprints.api.tickets import tracker_tickets_bulk_POST
+from todosrht.types import Event, EventType, Visibility
+
+
+def label_events(ticket):
+    return [(e.event_type, e.label.name) for e in (Event.query
+        .filter(Event.ticket_id == ticket.id)
+        .order_by(Event.id))]
+
+def test_put_labels(client, webhook_tasks):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    bug = f.LabelFactory(tracker=tracker, name="bug")
+    f.LabelFactory(tracker=tracker, name="feature")
+    f.LabelFactory(tracker=tracker, name="wontfix")
+    ticket = f.TicketFactory(tracker=tracker)
+    f.TicketLabelFactory(user=owner, ticket=ticket, label=bug)
+    db.session.commit()
+
+    def put(labels):
+        return api_request(tracker_ticket_by_id_PUT, owner, method="PUT",
+                json={"labels": labels}, username=f"~{owner.username}",
+                tracker_name=tracker.name, ticket_id=ticket.scoped_id)
+
+    # Unknown labels reject the whole request
+    response = put(["feature", "nope"])
+    assert response.status_code == 400
+    assert [l.name for l in ticket.labels] == ["bug"]
+    assert label_events(ticket) == []
+
+    response = put(["feature", "wontfix"])
+    assert response.status_code == 200
+    body = json.loads(response.get_data())
+    assert body["ticket"]["labels"] == ["feature", "wontfix"]
+
+    # Removals come first, and every event is returned and stored
+    removed, *added = body["events"]
+    assert removed["event_type"] == ["label_removed"]
+    assert removed["label"] == "bug"
+    assert all(e["event_type"] == ["label_added"] for e in added)
+    assert {e["label"] for e in added} == {"feature", "wontfix"}
+    events = label_events(ticket)
+    assert events[0] == (EventType.label_removed, "bug")
+    assert sorted(events[1:]) == [
+        (EventType.label_added, "feature"),
+        (EventType.label_added, "wontfix"),
+    ]
+    assert [l.name for l in ticket.labels] == ["feature", "wontfix"]
+
+    # Setting the same labels again changes nothing
+    response = put(["wontfix", "feature"])
+    assert response.status_code == 200
+    assert json.loads(response.get_data())["events"] == []
+    assert len(label_events(ticket)) == 3
+
+def test_bulk_labels(client, webhook_tasks):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    bug = f.LabelFactory(tracker=tracker, name="bug")
+    labelled = f.TicketFactory(tracker=tracker)
+    f.TicketLabelFactory(user=owner, ticket=labelled, label=bug)
+    ticket1 = f.TicketFactory(tracker=tracker)
+    ticket2 = f.TicketFactory(tracker=tracker)
+    untouched = f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    def bulk(operation):
+        response = api_request(tracker_tickets_bulk_POST, owner,
+                method="POST", json={
+                    "operation": operation,
+                    "labels": ["bug"],
+                    "tickets": [t.scoped_id
+                        for t in [labelled, ticket1, ticket2]],
+                },
+                username=f"~{owner.username}", tracker_name=tracker.name)
+        assert response.status_code == 200
+        return json.loads(response.get_data())
+
+    # Tickets which already have the label are matched but not changed
+    assert bulk("label") == {
+        "operation": "label",
+        "matched": 3,
+        "changed": 2,
+        "tickets": sorted([ticket1.scoped_id, ticket2.scoped_id]),
+    }
+    assert label_events(labelled) == []
+    for ticket in [labelled, ticket1, ticket2]:
+        assert [l.name for l in ticket.labels] == ["bug"]
+    for ticket in [ticket1, ticket2]:
+        assert label_events(ticket) == [(EventType.label_added, "bug")]
+    assert untouched.labels == []
+
+    assert bulk("unlabel")["changed"] == 3
+    for ticket in [labelled, ticket1, ticket2]:
+        assert ticket.labels == []
+    for ticket in [ticket1, ticket2]:
+        assert label_events(ticket) == [
+            (EventType.label_added, "bug"),
+            (EventType.label_removed, "bug"),
+        ]
@@ -0,0 +1,91 @@
+import sqlalchemy as sa
+from email.message import EmailMessage
+from srht.database import db
+from tests import factories as f
+from todosrht import lmtp
+from todosrht.lmtp import MailHandler
+from todosrht.types import Participant, TicketSubscription, Visibility
+from types import SimpleNamespace
+
+
+def make_envelope(rcpt_tos, sender="alice@example.org"):
+    mail = EmailMessage()
+    mail["From"] = f"Alice <{sender}>"
+    mail["To"] = ", ".join(rcpt_tos)
+    mail["Subject"] = "It does not work"
+    mail["Message-ID"] = "<1234@example.org>"
+    mail.set_content("Steps to reproduce: run it.")
+    return SimpleNamespace(content=mail.as_bytes(), rcpt_tos=rcpt_tos)
+
+def test_recipient_statuses(client, monkeypatch):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    broken = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    invalid = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    private = f.TrackerFactory(visibility=Visibility.PRIVATE)
+    ticket = f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    def exec_gql(site, query, user=None, valid=None, trackerId=None, **kw):
+        if trackerId == broken.id:
+            raise sa.exc.OperationalError("SELECT 1", {},
+                    Exception("server closed the connection"))
+        if trackerId == invalid.id:
+            raise ValueError("Unexpected response")
+        return {"submitTicketEmail": {"id": ticket.scoped_id}}
+    monkeypatch.setattr(lmtp, "exec_gql", exec_gql)
+
+    def address(tracker, suffix=""):
+        return f"~{tracker.owner.username}/{tracker.name}{suffix}@todo.sr.ht"
+
+    envelope = make_envelope([
+        address(broken),
+        address(tracker, "/subscribe"),
+        f"~{owner.username}/nope@todo.sr.ht",
+        address(private),
+        address(invalid),
+        address(tracker),
+    ])
+    statuses = MailHandler()._handle_DATA(envelope)
+
+    # Only the database error is worth retrying
+    assert statuses == [
+        "451 Requested action aborted: error in processing",
+        "250 Subscribed",
+        "550 The tracker or ticket you requested does not exist.",
+        "550 You do not have permission to post on this tracker.",
+        "554 Transaction failed: error in processing",
+        "250 Message accepted for delivery",
+    ]
+
+    # The sender survives the rollback of the first recipient
+    sender = (Participant.query
+        .filter(Participant.email == "alice@example.org")).one()
+    sub = (TicketSubscription.query
+        .filter(TicketSubscription.tracker_id == tracker.id)).one()
+    assert sub.participant_id == sender.id
+
+def test_html_rejected_before_parsing_body(monkeypatch):
+    mail = EmailMessage()
+    mail["From"] = "Alice <alice@example.org>"
+    mail["Subject"] = "It does not work"
+    mail.add_alternative("<p>Steps to reproduce: run it.</p>", subtype="html")
+    mail.add_attachment(b"\0" * (4 * lmtp.parse_chunk_size),
+            maintype="application", subtype="octet-stream",
+            filename="core.dump")
+    content = mail.as_bytes()
+
+    fed = list()
+    class BytesFeedParser(lmtp.BytesFeedParser):
+        def feed(self, data):
+            fed.append(data)
+            super().feed(data)
+
+        def close(self):
+            assert False, "the whole message was parsed"
+    monkeypatch.setattr(lmtp, "BytesFeedParser", BytesFeedParser)
+
+    body, error = MailHandler().get_body(content)
+    assert body is None
+    assert error == "550 HTML emails are not permitted on SourceHut"
+    assert sum(len(data) for data in fed) < len(content)
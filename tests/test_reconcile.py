@@ -0,0 +1,83 @@
+import json
+from srht.database import db
+from tests import factories as f
+from tests.utils import api_request
+from todosrht.blueprints.api.trackers import user_tracker_by_name_GET
+from todosrht.reconcile import reconcile_comment_counts
+from todosrht.reconcile import reconcile_label_counts
+from todosrht.reconcile import reconcile_tracker_counts
+from todosrht.types import TicketStatus, Visibility
+
+
+def test_tracker_counts(client):
+    tracker = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    other = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    tickets = [f.TicketFactory(tracker=tracker) for _ in range(3)]
+    f.TicketFactory(tracker=other, status=TicketStatus.resolved)
+    db.session.commit()
+
+    def reconcile(dry_run=False):
+        return reconcile_tracker_counts(tracker.id, tracker.id + 1, dry_run)
+
+    def counts():
+        return tracker.open_ticket_count, tracker.closed_ticket_count
+
+    def get():
+        response = api_request(user_tracker_by_name_GET, tracker.owner,
+                query_string={"fields": "open_tickets,closed_tickets"},
+                username=f"~{tracker.owner.username}",
+                tracker_name=tracker.name)
+        assert response.status_code == 200
+        body = json.loads(response.get_data())
+        return response.headers["ETag"], (
+                body["open_tickets"], body["closed_tickets"])
+
+    # The counters are maintained by triggers, which SQLite does not run, so
+    # they are only brought up to date by reconciling them
+    assert counts() == (0, 0)
+    assert reconcile(dry_run=True) == [tracker.id]
+    assert counts() == (0, 0)
+    assert reconcile() == [tracker.id]
+    assert counts() == (3, 0)
+    assert reconcile() == []
+    etag, body_counts = get()
+    assert body_counts == (3, 0)
+
+    tickets[0].status = TicketStatus.resolved
+    db.session.commit()
+    assert reconcile() == [tracker.id]
+    assert counts() == (2, 1)
+
+    # Responses change with the ticket version, which triggers bump along
+    # with the counts
+    tracker.stats.ticket_version += 1
+    db.session.commit()
+    new_etag, body_counts = get()
+    assert new_etag != etag
+    assert body_counts == (2, 1)
+
+    tickets[0].status = TicketStatus.reported
+    db.session.commit()
+    assert reconcile() == [tracker.id]
+    assert counts() == (3, 0)
+
+    # Only the requested range of trackers is reconciled
+    assert other.open_ticket_count == other.closed_ticket_count == 0
+    assert reconcile_tracker_counts(other.id, other.id + 1, False) == \
+        [other.id]
+    assert other.closed_ticket_count == 1
+
+def test_comment_and_label_counts(client):
+    tracker = f.TrackerFactory()
+    ticket = f.TicketFactory(tracker=tracker)
+    f.TicketCommentFactory(ticket=ticket)
+    f.TicketCommentFactory(ticket=ticket)
+    bug = f.LabelFactory(tracker=tracker, name="bug")
+    f.TicketLabelFactory(ticket=ticket, label=bug)
+    db.session.commit()
+
+    assert reconcile_comment_counts(ticket.id, ticket.id + 1, False) == \
+        [ticket.id]
+    assert ticket.comment_count == 2
+    assert reconcile_label_counts(bug.id, bug.id + 1, False) == [bug.id]
+    assert bug.ticket_count == 1
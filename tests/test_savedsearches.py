@@ -0,0 +1,84 @@
+from srht.database import db
+from tests import factories as f
+from todosrht.savedsearches import get_saved_searches, refresh_saved_search
+from todosrht.savedsearches import refresh_saved_searches
+from todosrht.types import SavedSearch, TicketLabel, TicketStatus
+from todosrht.types import Visibility
+
+
+def test_saved_searches(client):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PRIVATE)
+    private = f.TrackerFactory(visibility=Visibility.PRIVATE)
+
+    bug = f.LabelFactory(tracker=tracker, name="bug")
+    ticket1 = f.TicketFactory(tracker=tracker)
+    ticket2 = f.TicketFactory(tracker=tracker)
+    ticket3 = f.TicketFactory(tracker=tracker)
+    f.TicketLabelFactory(user=owner, ticket=ticket1, label=bug)
+    f.TicketLabelFactory(user=owner, ticket=ticket2, label=bug)
+
+    def save(tracker, name, search):
+        saved = SavedSearch(user_id=owner.id, tracker_id=tracker.id,
+                name=name, search=search)
+        db.session.add(saved)
+        return saved
+
+    bugs = save(tracker, "Bugs", "label:bug")
+    closed = save(tracker, "Closed", "status:closed")
+    invalid = save(tracker, "Invalid", "submitter:nobody")
+    save(private, "Not mine", "")
+    db.session.commit()
+
+    # Dashboards only read the results. Searches on trackers the user can no
+    # longer browse are left out.
+    assert get_saved_searches(owner) == [
+        (bugs, 2), (closed, 0), (invalid, None)]
+    assert bugs.tracker_version is None
+    assert bugs.tickets == []
+
+    # The first refresh searches every ticket. Invalid searches are left out.
+    assert refresh_saved_searches() == 3
+    assert {t.id for t in bugs.tickets} == {ticket1.id, ticket2.id}
+    assert bugs.tracker_version == tracker.ticket_version
+    assert invalid.tracker_version is None
+    assert get_saved_searches(owner) == [
+        (bugs, 2), (closed, 0), (invalid, None)]
+
+    # Later refreshes only search the tickets written since, and so do counts
+    # until then. The versions are normally bumped by database triggers.
+    tracker.stats.ticket_version += 1
+    ticket1.status = TicketStatus.resolved
+    ticket1.tracker_version = tracker.ticket_version
+    f.TicketLabelFactory(user=owner, ticket=ticket3, label=bug)
+    ticket3.tracker_version = tracker.ticket_version
+    db.session.commit()
+
+    assert get_saved_searches(owner) == [
+        (bugs, 2), (closed, 1), (invalid, None)]
+    assert {t.id for t in bugs.tickets} == {ticket1.id, ticket2.id}
+    assert refresh_saved_searches() == 2
+    assert {t.id for t in bugs.tickets} == {ticket2.id, ticket3.id}
+    assert [t.id for t in closed.tickets] == [ticket1.id]
+
+    # Tickets which were not written keep their previous result
+    TicketLabel.query.filter(TicketLabel.ticket_id == ticket3.id).delete()
+    db.session.commit()
+    refresh_saved_search(bugs)
+    db.session.commit()
+    db.session.expire(bugs)
+    assert {t.id for t in bugs.tickets} == {ticket2.id, ticket3.id}
+
+    # Results are rebuilt once a ticket leaves the tracker, as the tickets
+    # which are left were not written
+    tracker.stats.ticket_version += 1
+    tracker.stats.removed_version = tracker.stats.ticket_version
+    ticket2.tracker = private
+    db.session.commit()
+
+    assert get_saved_searches(owner) == [
+        (bugs, 0), (closed, 1), (invalid, None)]
+    refresh_saved_search(bugs)
+    db.session.commit()
+    db.session.expire(bugs)
+    assert bugs.tickets == []
@@ -1,9 +1,13 @@
 import pytest
+import sqlalchemy as sa
 
 from datetime import datetime
+from flask import current_app
 from tests import factories as f
-from todosrht.search import apply_search
-from todosrht.types import Ticket, TicketStatus
+from todosrht.access import browsable_trackers
+from todosrht.search import apply_search, paginate_capped, search_facets
+from todosrht.types import Ticket, TicketAccess, TicketStatus, UserAccess
+from todosrht.types import Visibility
 from srht.database import db
 
 
@@ -122,6 +126,14 @@ def test_ticket_search(client):
     assert search("!submitter:leia") == [ticket3, ticket2, ticket1]
     assert search("!submitter:han") == [ticket5, ticket4, ticket3]
 
+    assert search("submitter:~Luke") == [ticket3]
+    assert search("submitter:me") == []
+    assert search("submitter:me", leia.user) == [ticket5, ticket4]
+
+    with pytest.raises(ValueError) as excinfo:
+        search("submitter:yoda")
+    assert "Unknown user: 'yoda'" == str(excinfo.value)
+
     # Search by assignee
     assert search("assigned:luke") == [ticket2, ticket1]
     assert search("assigned:leia") == [ticket3, ticket2]
@@ -149,6 +161,11 @@ def test_ticket_search(client):
     assert search("!assigned:me", luke.user) == [ticket5, ticket4, ticket3]
     assert search("!assigned:me", leia.user) == [ticket5, ticket4, ticket1]
 
+    # "me" matches nobody for anonymous users
+    assert search("submitter:me", None) == []
+    assert search("assigned:me", None) == []
+    assert search("!assigned:me", None) == [ticket5, ticket4, ticket3, ticket2, ticket1]
+
     # Search by label
     assert search("label:jedi") == [ticket5, ticket1]
     assert search("label:sith") == [ticket5, ticket2]
@@ -248,3 +265,144 @@ def test_sorting(client):
         search("sort:foo")
 
     assert str(excinfo.value).startswith("Invalid sort value: 'foo'.")
+
+def test_search_facets(client):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner)
+    luke = f.UserFactory(username="luke")
+
+    ticket1 = f.TicketFactory(tracker=tracker)
+    ticket2 = f.TicketFactory(tracker=tracker, status=TicketStatus.confirmed)
+    ticket3 = f.TicketFactory(tracker=tracker, status=TicketStatus.resolved)
+
+    jedi = f.LabelFactory(tracker=tracker, name="jedi")
+    sith = f.LabelFactory(tracker=tracker, name="sith")
+    f.TicketLabelFactory(user=owner, ticket=ticket1, label=jedi)
+    f.TicketLabelFactory(user=owner, ticket=ticket2, label=jedi)
+    f.TicketLabelFactory(user=owner, ticket=ticket2, label=sith)
+    f.TicketLabelFactory(user=owner, ticket=ticket3, label=sith)
+    f.TicketAssigneeFactory(ticket=ticket2, assignee=luke, assigner=owner)
+    db.session.commit()
+
+    query = Ticket.query.filter(Ticket.tracker_id == tracker.id)
+
+    def facets(search_string):
+        return search_facets(apply_search(query, search_string, owner))
+
+    assert facets("status:open") == {
+        "status": [(TicketStatus.reported, 1), (TicketStatus.confirmed, 1)],
+        "labels": [(jedi, 2), (sith, 1)],
+        "assignees": [(luke, 1)],
+    }
+    assert facets("status:any label:sith") == {
+        "status": [(TicketStatus.confirmed, 1), (TicketStatus.resolved, 1)],
+        "labels": [(sith, 2), (jedi, 1)],
+        "assignees": [(luke, 1)],
+    }
+    assert facets("label:nope") == {
+        "status": [],
+        "labels": [],
+        "assignees": [],
+    }
+
+def query_plan(query):
+    """Returns the steps of SQLite's plan for a query."""
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        return "EXPLAIN QUERY PLAN " + statement, parameters
+
+    engine = db.session.get_bind()
+    sa.event.listen(engine, "before_cursor_execute", explain, retval=True)
+    try:
+        return [row[-1] for row in db.session.execute(query.statement)]
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", explain)
+
+def test_tracker_listing_uses_indexes(client):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner)
+    f.TicketFactory(tracker=tracker)
+    db.session.commit()
+
+    query = Ticket.query.filter(Ticket.tracker_id == tracker.id)
+
+    # Listings must be read in order from an index, rather than sorting all
+    # matching tickets of the tracker to find a single page
+    for search_string in [
+        "",
+        "sort:created",
+        "rsort:created",
+        "sort:comments",
+        "rsort:updated",
+        "status:closed",
+        "status:confirmed",
+        "label:bug",
+    ]:
+        plan = query_plan(apply_search(query, search_string, owner).limit(25))
+        assert not any("TEMP B-TREE" in step for step in plan), search_string
+
+def test_cross_tracker_search(client):
+    user = f.UserFactory()
+    other = f.UserFactory()
+
+    def tracker(visibility, permissions=None, owner=other):
+        tracker = f.TrackerFactory(owner=owner, visibility=visibility,
+                default_access=TicketAccess.browse + TicketAccess.submit)
+        if permissions is not None:
+            db.session.add(UserAccess(tracker=tracker, user=user,
+                permissions=permissions))
+        return tracker
+
+    owned = tracker(Visibility.PRIVATE, owner=user)
+    granted = tracker(Visibility.PRIVATE, TicketAccess.browse)
+    submit_only = tracker(Visibility.PRIVATE, TicketAccess.submit)
+    public = tracker(Visibility.PUBLIC)
+    revoked = tracker(Visibility.PUBLIC, TicketAccess.none)
+    unlisted = tracker(Visibility.UNLISTED)
+    trackers = [owned, granted, submit_only, public, revoked, unlisted]
+
+    tickets = {t: f.TicketFactory(tracker=t) for t in trackers}
+    db.session.commit()
+
+    def search(search_string, include_public=False):
+        query = Ticket.query.filter(Ticket.tracker_id.in_(
+            browsable_trackers(user, include_public)))
+        return {t.tracker for t in apply_search(query, search_string, user)}
+
+    assert search("") == {owned, granted}
+    assert search("", include_public=True) == {owned, granted, public}
+
+    # Search terms apply across trackers
+    f.TicketAssigneeFactory(ticket=tickets[granted], assignee=user,
+            assigner=other)
+    f.TicketAssigneeFactory(ticket=tickets[revoked], assignee=user,
+            assigner=other)
+    db.session.commit()
+    assert search("assigned:me", include_public=True) == {granted}
+
+def test_paginate_capped(client):
+    tracker = f.TrackerFactory()
+    tickets = [f.TicketFactory(tracker=tracker) for _ in range(5)]
+    db.session.commit()
+    query = Ticket.query.filter(Ticket.tracker_id == tracker.id)
+    query = query.order_by(Ticket.id)
+
+    def paginate(page, max_results):
+        with current_app.test_request_context(query_string=f"page={page}"):
+            return paginate_capped(query,
+                    results_per_page=2, max_results=max_results)
+
+    assert paginate(2, 10) == (tickets[2:4], {
+        "total_pages": 3,
+        "page": 2,
+        "total_results": 5,
+        "more_results": False,
+    })
+
+    # Past max_results, tickets are no longer counted
+    assert paginate(2, 3) == (tickets[2:4], {
+        "total_pages": 2,
+        "page": 2,
+        "total_results": 3,
+        "more_results": True,
+    })
+    assert paginate(1, 5)[1]["more_results"] is False
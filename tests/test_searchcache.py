@@ -0,0 +1,49 @@
+from flask import current_app
+from srht.database import db
+from tests import factories as f
+from todosrht.search import requested_page
+from todosrht.searchcache import search_key
+from todosrht.types import TicketAccess
+
+
+def test_search_key(client):
+    owner = f.UserFactory()
+    other = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner)
+    db.session.commit()
+
+    def key(search_string, access=TicketAccess.all, user=owner, page=1):
+        return search_key(tracker, search_string, access, user, page, 25)
+
+    # Equivalent searches share their results
+    assert key("label:bug status:open") == key("status:open label:bug")
+    assert key("label:bug") == key("label:bug label:bug")
+    assert key("") == key("status:open sort:updated")
+    assert key("label:bug", user=owner) == key("label:bug", user=other)
+
+    assert key("label:bug") != key("!label:bug")
+    assert key("label:bug") != key("label:bug", page=2)
+    assert key("sort:created sort:updated") != key("sort:updated sort:created")
+
+    # Results depend on who is searching when they list their own tickets, or
+    # search for themselves
+    assert key("assigned:me", user=owner) != key("assigned:me", user=other)
+    assert (key("label:bug", access=TicketAccess.submit, user=owner)
+        != key("label:bug", access=TicketAccess.submit, user=other))
+    assert key("label:bug", access=TicketAccess.submit) != key("label:bug")
+    assert key("label:bug", access=TicketAccess.none, user=None) is None
+
+    # Any write to the tracker's tickets invalidates its results
+    before = key("label:bug")
+    tracker.stats.ticket_version += 1
+    assert key("label:bug") != before
+
+def test_requested_page(client):
+    def page(query_string):
+        with current_app.test_request_context(query_string=query_string):
+            return requested_page()
+
+    # Each page has a single number, whichever way it is requested
+    assert page("") == page("page=1") == page("page=0") == 1
+    assert page("page=x") == page("page=-2") == 1
+    assert page("page=2") == page("page=02") == 2
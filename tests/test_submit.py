@@ -3,7 +3,7 @@ from itertools import chain
 from srht.database import db
 from tests.factories import UserFactory, TrackerFactory, TicketFactory
 from tests.factories import ParticipantFactory
-from todosrht.tickets import submit_ticket
+from todosrht.tickets import allocate_ticket_ids, submit_ticket
 from todosrht.types import Ticket, EventType, TicketSubscription, Event
 from todosrht.urls import ticket_url
 
@@ -156,3 +156,17 @@ def test_mentions_in_ticket_description(mailbox):
     assert p2_email.headers["In-Reply-To"] == (
         f'<~{tracker.owner.username}/{tracker.name}/{ticket.scoped_id}@example.org>'
     )
+
+def test_allocate_ticket_ids():
+    tracker = TrackerFactory()
+    db.session.commit()
+
+    assert allocate_ticket_ids(tracker) == 1
+    # Reserve a range, e.g. for an import
+    assert allocate_ticket_ids(tracker, 10) == 2
+    assert allocate_ticket_ids(tracker) == 12
+
+    # Reserved IDs are committed on their own, and not handed out again if
+    # the submission is rolled back
+    db.session.rollback()
+    assert tracker.next_ticket_id == 13
@@ -3,7 +3,7 @@ from tests.factories import TrackerFactory, TicketFactory, UserFactory
 from tests.factories import ParticipantFactory
 from tests.utils import logged_in_as
 from todosrht.tickets import get_or_create_subscription
-from todosrht.types import TicketSubscription
+from todosrht.types import Ticket, TicketSubscription
 from todosrht.urls import ticket_url
 
 def test_get_or_create_subscription():
@@ -33,3 +33,18 @@ def test_get_or_create_subscription():
 
     assert set(ticket.subscriptions) == set([ts1, ts3])
     assert set(tracker.subscriptions) == set([ts2])
+
+def test_ticket_to_dict_fields():
+    ticket = TicketFactory()
+    db.session.commit()
+
+    assert ticket.to_dict().keys() == Ticket.dict_fields.keys()
+    assert ticket.to_dict(fields={"id", "title", "labels"}) == {
+        "id": ticket.scoped_id,
+        "title": ticket.title,
+        "labels": [],
+    }
+    # Fields missing from the short form are never included
+    assert ticket.to_dict(short=True, fields={"id", "labels"}) == {
+        "id": ticket.scoped_id,
+    }
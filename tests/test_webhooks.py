@@ -0,0 +1,195 @@
+import json
+from flask import current_app, g
+from srht.database import db
+from tests import factories as f
+from tests.utils import api_request
+from todosrht import webhooks
+from todosrht.blueprints.api.tickets import tracker_ticket_by_id_PUT
+from todosrht.serialize import serialize
+from todosrht.types import Event, Visibility
+from todosrht.webhooks import TicketWebhook, TrackerWebhook, WebhookBatch
+
+
+def subscribe(cls, events, **route):
+    sub = cls.Subscription(url="https://example.org/webhook", **route)
+    sub.events = events
+    db.session.add(sub)
+    return sub
+
+def delivered(tasks):
+    """
+    Maps (webhook, subscription ID) to the payloads of the task queued for
+    that subscription, checking that each subscription got a single task.
+    """
+    received = dict()
+    for webhook, sub_id, events, committed in tasks:
+        assert committed
+        assert (webhook, sub_id) not in received
+        received[(webhook, sub_id)] = [json.loads(payload)
+            for event, payload in events]
+    return received
+
+def test_webhooks_delivered_after_commit(client, no_emails, webhook_tasks):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    ticket = f.TicketFactory(tracker=tracker)
+    tracker_sub = subscribe(TrackerWebhook,
+            [TrackerWebhook.Events.event_create], tracker_id=tracker.id)
+    ticket_sub = subscribe(TicketWebhook,
+            [TicketWebhook.Events.event_create], ticket_id=ticket.id)
+    db.session.commit()
+
+    def put(body):
+        return api_request(tracker_ticket_by_id_PUT, owner, method="PUT",
+                json=body, username=f"~{owner.username}",
+                tracker_name=tracker.name, ticket_id=ticket.scoped_id)
+
+    # Nothing is sent for requests which fail validation
+    response = put({"comment": "x"})
+    assert response.status_code == 400
+    assert webhook_tasks == []
+
+    response = put({"comment": "This is a helpful comment."})
+    assert response.status_code == 200
+    [event] = json.loads(response.get_data())["events"]
+
+    # Each subscriber receives one task, queued once the event is committed
+    assert delivered(webhook_tasks) == {
+        ("TrackerWebhook", tracker_sub.id): [event],
+        ("TicketWebhook", ticket_sub.id): [event],
+    }
+
+def test_webhook_batch(client, webhook_tasks):
+    tracker = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    tickets_sub = subscribe(TrackerWebhook,
+            [TrackerWebhook.Events.ticket_create], tracker_id=tracker.id)
+    all_sub = subscribe(TrackerWebhook, [
+        TrackerWebhook.Events.ticket_create,
+        TrackerWebhook.Events.label_create,
+    ], tracker_id=tracker.id)
+    subscribe(TrackerWebhook,
+            [TrackerWebhook.Events.event_create], tracker_id=tracker.id)
+    db.session.commit()
+
+    batch = WebhookBatch()
+    batch.add(TrackerWebhook, TrackerWebhook.Events.ticket_create,
+            {"id": 1}, tracker.id)
+    batch.add(TrackerWebhook, TrackerWebhook.Events.label_create,
+            {"id": 2}, tracker.id)
+    batch.add(TrackerWebhook, TrackerWebhook.Events.ticket_create,
+            {"id": 3}, tracker.id)
+    assert webhook_tasks == []
+    batch.deliver()
+
+    # One task per subscription with matching events, carrying those events
+    # in order. Subscriptions without any matching event receive nothing.
+    assert delivered(webhook_tasks) == {
+        ("TrackerWebhook", tickets_sub.id): [{"id": 1}, {"id": 3}],
+        ("TrackerWebhook", all_sub.id): [{"id": 1}, {"id": 2}, {"id": 3}],
+    }
+
+def test_payloads_serialized_once(client, no_emails, webhook_tasks,
+        monkeypatch):
+    owner = f.UserFactory()
+    tracker = f.TrackerFactory(owner=owner, visibility=Visibility.PUBLIC)
+    ticket = f.TicketFactory(tracker=tracker)
+    for _ in range(3):
+        subscribe(TrackerWebhook,
+                [TrackerWebhook.Events.event_create], tracker_id=tracker.id)
+    subscribe(TicketWebhook,
+            [TicketWebhook.Events.event_create], ticket_id=ticket.id)
+    db.session.commit()
+
+    serialized = list()
+    to_dict = Event.to_dict
+    def counting_to_dict(self, *args, **kwargs):
+        serialized.append(self.id)
+        return to_dict(self, *args, **kwargs)
+    monkeypatch.setattr(Event, "to_dict", counting_to_dict)
+
+    response = api_request(tracker_ticket_by_id_PUT, owner, method="PUT",
+            json={"comment": "This is a helpful comment."},
+            username=f"~{owner.username}",
+            tracker_name=tracker.name, ticket_id=ticket.scoped_id)
+    assert response.status_code == 200
+    [event] = json.loads(response.get_data())["events"]
+
+    # The event is delivered to four subscriptions and included in the
+    # response, from a single serialization
+    assert len(webhook_tasks) == 4
+    assert serialized == [event["id"]]
+    for webhook, sub_id, events, committed in webhook_tasks:
+        [(event_type, payload)] = events
+        assert event_type == "event:create"
+        assert json.loads(payload) == event
+
+def test_serialize_memo(client):
+    ticket = f.TicketFactory()
+    db.session.commit()
+
+    with current_app.test_request_context():
+        first = serialize(ticket)
+        ticket.title = "A tamed ticket"
+        assert serialize(ticket) == first
+        assert serialize(ticket, memo=False) != first
+        assert serialize(ticket) == first
+        assert g.serialized[(type(ticket), ticket.id)] == first
+    db.session.rollback()
+
+def test_routes_invalidated_on_commit(client, webhook_tasks):
+    tracker = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    db.session.commit()
+
+    def routes():
+        return [(url, events) for sub_id, url, events
+            in webhooks.get_routes(TrackerWebhook, tracker.id)]
+
+    assert routes() == []
+
+    # Changes are only seen by other lookups once they are committed
+    sub = subscribe(TrackerWebhook,
+            [TrackerWebhook.Events.ticket_create], tracker_id=tracker.id)
+    db.session.flush()
+    assert routes() == []
+    db.session.commit()
+    assert routes() == [("https://example.org/webhook", ["ticket:create"])]
+
+    sub.url = "https://example.org/changed"
+    db.session.commit()
+    assert routes() == [("https://example.org/changed", ["ticket:create"])]
+
+    db.session.delete(sub)
+    db.session.commit()
+    assert routes() == []
+
+def test_deliver_batch(client, monkeypatch):
+    tracker = f.TrackerFactory(visibility=Visibility.PUBLIC)
+    sub = subscribe(TrackerWebhook, [
+        TrackerWebhook.Events.ticket_create,
+        TrackerWebhook.Events.event_create,
+    ], tracker_id=tracker.id)
+    db.session.commit()
+
+    notified = list()
+    def notify(cls, sub, event, payload, delay=True):
+        notified.append((sub.id, event, payload, delay))
+    monkeypatch.setattr(TrackerWebhook, "notify", classmethod(notify))
+
+    # Each event is sent by the webhook class, in order, within the task
+    webhooks.deliver_batch("TrackerWebhook", sub.id, [
+        ("ticket:create", '{"id": 1}'),
+        ("event:create", '{"id": 2}'),
+    ])
+    assert notified == [
+        (sub.id, TrackerWebhook.Events.ticket_create, '{"id": 1}', False),
+        (sub.id, TrackerWebhook.Events.event_create, '{"id": 2}', False),
+    ]
+
+    # Nothing is sent to subscriptions deleted in the meantime
+    sub_id = sub.id
+    db.session.delete(sub)
+    db.session.commit()
+    webhooks.deliver_batch("TrackerWebhook", sub_id, [
+        ("ticket:create", '{"id": 3}'),
+    ])
+    assert len(notified) == 2
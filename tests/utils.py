@@ -1,5 +1,23 @@
+import sys
+from flask import current_app
+from types import SimpleNamespace
 from unittest.mock import patch
 
 def logged_in_as(user):
     """Mocks that the given user is logged in."""
     return patch('flask_login.utils._get_user', return_value=user)
+
+def api_request(view, user, method="GET", json=None, query_string=None,
+        headers=None, **view_args):
+    """
+    Calls an API view as the given user, bypassing OAuth, and returns its
+    response with the body already read.
+    """
+    token = SimpleNamespace(user=user, user_id=user.id, token_partial="test")
+    module = sys.modules[view.__module__]
+    with patch.object(module, "current_token", token):
+        with current_app.test_request_context(method=method, json=json,
+                query_string=query_string, headers=headers):
+            response = current_app.make_response(view.__wrapped__(**view_args))
+            response.get_data()
+            return response
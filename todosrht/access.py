@@ -1,3 +1,4 @@
+import sqlalchemy as sa
 from flask import abort
 from srht.oauth import current_user
 from todosrht.types import TicketAccess, UserAccess, Participant
@@ -26,6 +27,57 @@ def get_access(tracker, ticket, user=None):
         return TicketAccess.none
     return tracker.default_access
 
+def get_trackers_access(trackers, user):
+    """
+    Returns a dict mapping the ID of each of the given trackers to a user's
+    access, following the same rules as get_access, from a single query of
+    the user's ACL entries.
+    """
+    ids = [tracker.id for tracker in trackers if tracker.owner_id != user.id]
+    acl = dict()
+    if ids:
+        acl = {ua.tracker_id: ua.permissions for ua in UserAccess.query
+            .filter(UserAccess.user_id == user.id)
+            .filter(UserAccess.tracker_id.in_(ids))}
+
+    access = dict()
+    for tracker in trackers:
+        if tracker.owner_id == user.id:
+            access[tracker.id] = TicketAccess.all
+        elif tracker.id in acl:
+            access[tracker.id] = acl[tracker.id]
+        elif tracker.visibility == Visibility.PRIVATE:
+            access[tracker.id] = TicketAccess.none
+        else:
+            access[tracker.id] = tracker.default_access
+    return access
+
+def browsable_trackers(user, include_public=False):
+    """
+    Returns a select of the IDs of the trackers whose tickets a user can
+    browse, following the same rules as get_access: trackers they own, and
+    those their ACL entries grant browse access to. Public trackers which
+    let everyone browse are included if asked, unless an ACL entry of the
+    user overrides it.
+    """
+    def can_browse(permissions):
+        permissions = sa.type_coerce(permissions, sa.Integer)
+        return permissions.op("&")(int(TicketAccess.browse)) != 0
+
+    owned = sa.select([Tracker.id]).where(Tracker.owner_id == user.id)
+    granted = (sa.select([UserAccess.tracker_id])
+        .where(UserAccess.user_id == user.id)
+        .where(can_browse(UserAccess.permissions)))
+    if not include_public:
+        return sa.union(owned, granted)
+
+    public = (sa.select([Tracker.id])
+        .where(Tracker.visibility == Visibility.PUBLIC)
+        .where(can_browse(Tracker.default_access))
+        .where(~sa.exists()
+            .where(UserAccess.tracker_id == Tracker.id)
+            .where(UserAccess.user_id == user.id)))
+    return sa.union(owned, granted, public)
 
 def get_tracker(owner, name, with_for_update=False, user=None):
     if not owner:
@@ -49,10 +101,19 @@ def get_tracker(owner, name, with_for_update=False, user=None):
     tracker = tracker.one_or_none()
     if not tracker:
         return None, None
+    return tracker, _get_tracker_access(tracker, user)
+
+def get_tracker_by_id(tracker_id, user=None):
+    tracker = Tracker.query.get(tracker_id)
+    if not tracker:
+        return None, None
+    return tracker, _get_tracker_access(tracker, user)
+
+def _get_tracker_access(tracker, user):
     access = get_access(tracker, None, user=user)
     if access == TicketAccess.none and tracker.visibility == Visibility.PRIVATE:
         abort(401)
-    return tracker, access
+    return access
 
 def get_ticket(tracker, ticket_id, user=None):
     user = user or current_user
@@ -0,0 +1,27 @@
+"""Add event notification feed index
+
+Revision ID: 10db72ec4733
+Revises: 8c640393207c
+Create Date: 2026-10-19 19:12:40.518723
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '10db72ec4733'
+down_revision = '8c640393207c'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX event_notification_user_id_created
+        ON event_notification (user_id, created DESC, event_id);
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX event_notification_user_id_created;
+    """)
@@ -0,0 +1,28 @@
+"""Add cross-tracker search indexes
+
+Revision ID: 2c5e0f7a9b41
+Revises: 8f1266cdd62e
+Create Date: 2026-10-19 23:41:06.512832
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2c5e0f7a9b41'
+down_revision = '8f1266cdd62e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX user_access_user_id ON user_access (user_id);
+    CREATE INDEX ticket_open_updated ON ticket (updated) WHERE status != 8;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX ticket_open_updated;
+    DROP INDEX user_access_user_id;
+    """)
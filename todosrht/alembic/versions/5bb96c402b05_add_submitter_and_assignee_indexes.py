@@ -0,0 +1,28 @@
+"""Add ticket submitter and assignee indexes
+
+Revision ID: 5bb96c402b05
+Revises: f45ba7a1e208
+Create Date: 2026-10-19 20:41:05.803126
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5bb96c402b05'
+down_revision = 'f45ba7a1e208'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX ticket_submitter_id ON ticket (submitter_id);
+    CREATE INDEX ticket_assignee_assignee_id ON ticket_assignee (assignee_id);
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX ticket_assignee_assignee_id;
+    DROP INDEX ticket_submitter_id;
+    """)
@@ -0,0 +1,40 @@
+"""Bump tracker version on label rename
+
+Revision ID: 6bbcb3c4bdcf
+Revises: 9d754183987c
+Create Date: 2026-10-19 22:15:09.337512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6bbcb3c4bdcf'
+down_revision = '9d754183987c'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    -- Renaming a label changes which tickets searches for it match
+    CREATE FUNCTION bump_tracker_label_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tracker_ticket_stats SET ticket_version = ticket_version + 1
+        WHERE tracker_id = NEW.tracker_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER label_tracker_version
+        AFTER UPDATE OF name ON label
+        FOR EACH ROW
+        WHEN (OLD.name != NEW.name)
+        EXECUTE PROCEDURE bump_tracker_label_version();
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER label_tracker_version ON label;
+    DROP FUNCTION bump_tracker_label_version;
+    """)
@@ -0,0 +1,36 @@
+"""Add tracker listing indexes
+
+Revision ID: 7bde03a6db99
+Revises: 5bb96c402b05
+Create Date: 2026-10-19 21:02:48.126690
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7bde03a6db99'
+down_revision = '5bb96c402b05'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX ticket_tracker_id_status_updated
+        ON ticket (tracker_id, status, updated);
+    CREATE INDEX ticket_open_tracker_id_updated
+        ON ticket (tracker_id, updated) WHERE status != 8;
+    CREATE INDEX ticket_open_tracker_id_created
+        ON ticket (tracker_id, created) WHERE status != 8;
+    CREATE INDEX ticket_open_tracker_id_comment_count
+        ON ticket (tracker_id, comment_count) WHERE status != 8;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX ticket_open_tracker_id_comment_count;
+    DROP INDEX ticket_open_tracker_id_created;
+    DROP INDEX ticket_open_tracker_id_updated;
+    DROP INDEX ticket_tracker_id_status_updated;
+    """)
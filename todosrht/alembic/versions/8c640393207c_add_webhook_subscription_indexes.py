@@ -0,0 +1,33 @@
+"""Add webhook subscription indexes
+
+Revision ID: 8c640393207c
+Revises: 8f822cabf78b
+Create Date: 2026-10-19 17:52:03.104512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c640393207c'
+down_revision = '8f822cabf78b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX tracker_webhook_subscription_tracker_id
+        ON tracker_webhook_subscription (tracker_id);
+    CREATE INDEX gql_tracker_wh_sub_tracker_id_idx
+        ON gql_tracker_wh_sub (tracker_id);
+    CREATE INDEX gql_ticket_wh_sub_ticket_id_idx
+        ON gql_ticket_wh_sub (ticket_id);
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX tracker_webhook_subscription_tracker_id;
+    DROP INDEX gql_tracker_wh_sub_tracker_id_idx;
+    DROP INDEX gql_ticket_wh_sub_ticket_id_idx;
+    """)
@@ -0,0 +1,68 @@
+"""Add saved searches
+
+Revision ID: 8f1266cdd62e
+Revises: 6bbcb3c4bdcf
+Create Date: 2026-10-19 22:48:31.904127
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8f1266cdd62e'
+down_revision = '6bbcb3c4bdcf'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE TABLE saved_search (
+        id serial PRIMARY KEY,
+        created timestamp without time zone NOT NULL,
+        updated timestamp without time zone NOT NULL,
+        user_id integer NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+        tracker_id integer NOT NULL REFERENCES tracker(id) ON DELETE CASCADE,
+        name character varying(128) NOT NULL,
+        search character varying(2048) NOT NULL,
+        tracker_version integer,
+        CONSTRAINT uq_saved_search_user_id_tracker_id_name
+            UNIQUE (user_id, tracker_id, name)
+    );
+
+    CREATE TABLE saved_search_ticket (
+        saved_search_id integer NOT NULL
+            REFERENCES saved_search(id) ON DELETE CASCADE,
+        ticket_id integer NOT NULL REFERENCES ticket(id) ON DELETE CASCADE,
+        PRIMARY KEY (saved_search_id, ticket_id)
+    );
+
+    CREATE INDEX saved_search_ticket_ticket_id
+        ON saved_search_ticket (ticket_id);
+
+    -- Renaming a label changes which tickets searches for it match, so its
+    -- tickets count as written as well
+    CREATE OR REPLACE FUNCTION bump_tracker_label_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tracker_ticket_stats SET ticket_version = ticket_version + 1
+        WHERE tracker_id = NEW.tracker_id;
+        UPDATE ticket SET tracker_version = 0
+        WHERE id IN (SELECT ticket_id FROM ticket_label WHERE label_id = NEW.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION bump_tracker_label_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE tracker_ticket_stats SET ticket_version = ticket_version + 1
+        WHERE tracker_id = NEW.tracker_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TABLE saved_search_ticket;
+    DROP TABLE saved_search;
+    """)
@@ -0,0 +1,141 @@
+"""Add tracker ticket version
+
+Revision ID: 9d754183987c
+Revises: 7bde03a6db99
+Create Date: 2026-10-19 21:37:52.460118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d754183987c'
+down_revision = '7bde03a6db99'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    ALTER TABLE tracker_ticket_stats
+        ADD COLUMN ticket_version integer DEFAULT 0 NOT NULL,
+        ADD COLUMN removed_version integer DEFAULT 0 NOT NULL;
+    ALTER TABLE ticket
+        ADD COLUMN tracker_version integer DEFAULT 0 NOT NULL;
+
+    CREATE INDEX ticket_tracker_id_tracker_version
+        ON ticket (tracker_id, tracker_version);
+
+    -- Keeps tracker_ticket_stats current, and stamps written tickets with the new
+    -- ticket_version. Runs when the transaction commits, so that ticket writes do
+    -- not hold a lock on their tracker's stats for the rest of the transaction.
+    -- removed_version records the last ticket deleted from or moved out of the
+    -- tracker. Tickets are closed when their status is resolved (8).
+    CREATE OR REPLACE FUNCTION update_tracker_ticket_stats() RETURNS trigger AS $$
+    DECLARE
+        old_open integer := 0;
+        old_closed integer := 0;
+        new_version integer;
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.tracker_id = NEW.tracker_id THEN
+            old_open := (OLD.status != 8)::integer;
+            old_closed := (OLD.status = 8)::integer;
+        ELSIF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tracker_ticket_stats SET
+                ticket_version = ticket_version + 1,
+                removed_version = ticket_version + 1,
+                open_ticket_count = open_ticket_count - (OLD.status != 8)::integer,
+                closed_ticket_count = closed_ticket_count - (OLD.status = 8)::integer,
+                updated = now() AT TIME ZONE 'UTC'
+            WHERE tracker_id = OLD.tracker_id;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN NULL;
+        END IF;
+        UPDATE tracker_ticket_stats SET
+            ticket_version = ticket_version + 1,
+            open_ticket_count = open_ticket_count + (NEW.status != 8)::integer - old_open,
+            closed_ticket_count = closed_ticket_count + (NEW.status = 8)::integer - old_closed,
+            updated = now() AT TIME ZONE 'UTC'
+        WHERE tracker_id = NEW.tracker_id
+        RETURNING ticket_version INTO new_version;
+        UPDATE ticket SET tracker_version = new_version WHERE id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Every write to a ticket now bumps the version. Stamping a ticket changes
+    -- its tracker_version, which is not counted as a write. touch_ticket_version
+    -- sets it to 0 to count as one.
+    DROP TRIGGER ticket_update_tracker_stats ON ticket;
+    CREATE CONSTRAINT TRIGGER ticket_update_tracker_stats
+        AFTER UPDATE ON ticket
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW
+        WHEN (NEW.tracker_version = OLD.tracker_version
+            OR NEW.tracker_version = 0)
+        EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+    -- Counts label and assignee changes as writes to their ticket. The version set
+    -- here is replaced by ticket_update_tracker_stats.
+    CREATE FUNCTION touch_ticket_version() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE ticket SET tracker_version = 0 WHERE id = NEW.ticket_id;
+        ELSE
+            UPDATE ticket SET tracker_version = 0 WHERE id = OLD.ticket_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER ticket_label_ticket_version
+        AFTER INSERT OR DELETE ON ticket_label
+        FOR EACH ROW EXECUTE PROCEDURE touch_ticket_version();
+
+    CREATE TRIGGER ticket_assignee_ticket_version
+        AFTER INSERT OR DELETE ON ticket_assignee
+        FOR EACH ROW EXECUTE PROCEDURE touch_ticket_version();
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER ticket_assignee_ticket_version ON ticket_assignee;
+    DROP TRIGGER ticket_label_ticket_version ON ticket_label;
+    DROP FUNCTION touch_ticket_version;
+
+    DROP TRIGGER ticket_update_tracker_stats ON ticket;
+    CREATE CONSTRAINT TRIGGER ticket_update_tracker_stats
+        AFTER UPDATE ON ticket
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW
+        WHEN ((OLD.status = 8) != (NEW.status = 8)
+            OR OLD.tracker_id != NEW.tracker_id)
+        EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+    CREATE OR REPLACE FUNCTION update_tracker_ticket_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tracker_ticket_stats SET
+                open_ticket_count = open_ticket_count - (OLD.status != 8)::integer,
+                closed_ticket_count = closed_ticket_count - (OLD.status = 8)::integer,
+                updated = now() AT TIME ZONE 'UTC'
+            WHERE tracker_id = OLD.tracker_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE tracker_ticket_stats SET
+                open_ticket_count = open_ticket_count + (NEW.status != 8)::integer,
+                closed_ticket_count = closed_ticket_count + (NEW.status = 8)::integer,
+                updated = now() AT TIME ZONE 'UTC'
+            WHERE tracker_id = NEW.tracker_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP INDEX ticket_tracker_id_tracker_version;
+    ALTER TABLE ticket DROP COLUMN tracker_version;
+    ALTER TABLE tracker_ticket_stats
+        DROP COLUMN removed_version,
+        DROP COLUMN ticket_version;
+    """)
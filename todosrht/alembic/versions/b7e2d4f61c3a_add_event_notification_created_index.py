@@ -0,0 +1,26 @@
+"""Add event notification created index
+
+Revision ID: b7e2d4f61c3a
+Revises: 2c5e0f7a9b41
+Create Date: 2026-10-20 10:03:27.905162
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4f61c3a'
+down_revision = '2c5e0f7a9b41'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    CREATE INDEX event_notification_created ON event_notification (created);
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX event_notification_created;
+    """)
@@ -0,0 +1,131 @@
+"""Add tracker and label ticket counters
+
+Revision ID: f45ba7a1e208
+Revises: 10db72ec4733
+Create Date: 2026-10-19 20:03:17.284190
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f45ba7a1e208'
+down_revision = '10db72ec4733'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("""
+    -- Kept apart from the tracker row, so that counting tickets does not
+    -- serialize writes to the tracker itself
+    CREATE TABLE tracker_ticket_stats (
+        tracker_id integer PRIMARY KEY
+            REFERENCES tracker(id) ON DELETE CASCADE,
+        open_ticket_count integer DEFAULT 0 NOT NULL,
+        closed_ticket_count integer DEFAULT 0 NOT NULL,
+        updated timestamp without time zone
+    );
+    ALTER TABLE label
+        ADD COLUMN ticket_count integer DEFAULT 0 NOT NULL;
+
+    INSERT INTO tracker_ticket_stats (tracker_id,
+        open_ticket_count, closed_ticket_count, updated)
+    SELECT tr.id,
+        coalesce(c.open, 0), coalesce(c.closed, 0), c.updated
+    FROM tracker tr
+    LEFT JOIN (
+        SELECT tracker_id,
+            count(*) FILTER (WHERE status != 8) AS open,
+            count(*) FILTER (WHERE status = 8) AS closed,
+            max(updated) AS updated
+        FROM ticket
+        GROUP BY tracker_id
+    ) c ON c.tracker_id = tr.id;
+
+    CREATE FUNCTION create_tracker_ticket_stats() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO tracker_ticket_stats (tracker_id) VALUES (NEW.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER tracker_ticket_stats
+        AFTER INSERT ON tracker
+        FOR EACH ROW EXECUTE PROCEDURE create_tracker_ticket_stats();
+
+    -- Keeps tracker_ticket_stats current. Runs when the transaction commits, so
+    -- that ticket writes do not hold a lock on their tracker's stats for the rest
+    -- of the transaction. Tickets are closed when their status is resolved (8).
+    CREATE FUNCTION update_tracker_ticket_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tracker_ticket_stats SET
+                open_ticket_count = open_ticket_count - (OLD.status != 8)::integer,
+                closed_ticket_count = closed_ticket_count - (OLD.status = 8)::integer,
+                updated = now() AT TIME ZONE 'UTC'
+            WHERE tracker_id = OLD.tracker_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE tracker_ticket_stats SET
+                open_ticket_count = open_ticket_count + (NEW.status != 8)::integer,
+                closed_ticket_count = closed_ticket_count + (NEW.status = 8)::integer,
+                updated = now() AT TIME ZONE 'UTC'
+            WHERE tracker_id = NEW.tracker_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE CONSTRAINT TRIGGER ticket_insert_delete_tracker_stats
+        AFTER INSERT OR DELETE ON ticket
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+    CREATE CONSTRAINT TRIGGER ticket_update_tracker_stats
+        AFTER UPDATE ON ticket
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW
+        WHEN ((OLD.status = 8) != (NEW.status = 8)
+            OR OLD.tracker_id != NEW.tracker_id)
+        EXECUTE PROCEDURE update_tracker_ticket_stats();
+
+    -- Keeps label.ticket_count current
+    CREATE FUNCTION update_label_ticket_count() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE label SET ticket_count = ticket_count + 1
+            WHERE id = NEW.label_id;
+        ELSE
+            UPDATE label SET ticket_count = ticket_count - 1
+            WHERE id = OLD.label_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER ticket_label_label_count
+        AFTER INSERT OR DELETE ON ticket_label
+        FOR EACH ROW EXECUTE PROCEDURE update_label_ticket_count();
+
+    UPDATE label l SET ticket_count = c.count
+    FROM (
+        SELECT label_id, count(*) AS count
+        FROM ticket_label
+        GROUP BY label_id
+    ) c
+    WHERE l.id = c.label_id;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER ticket_label_label_count ON ticket_label;
+    DROP TRIGGER ticket_update_tracker_stats ON ticket;
+    DROP TRIGGER ticket_insert_delete_tracker_stats ON ticket;
+    DROP TRIGGER tracker_ticket_stats ON tracker;
+    DROP FUNCTION update_label_ticket_count;
+    DROP FUNCTION update_tracker_ticket_stats;
+    DROP FUNCTION create_tracker_ticket_stats;
+    ALTER TABLE label DROP COLUMN ticket_count;
+    DROP TABLE tracker_ticket_stats;
+    """)
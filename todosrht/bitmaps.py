@@ -0,0 +1,338 @@
+"""
+In-memory bitmap indexes of large trackers, which answer searches by status,
+label, submitter and assignee with set operations rather than SQL.
+
+Each process keeps the indexes of the trackers it searched most recently.
+Tickets are numbered by the order in which they were loaded into an index,
+and each bitmap is a Python integer with one bit set per matching ticket.
+Before each search, an index loads the tickets written since the tracker
+version it was last brought up to date with.
+"""
+import threading
+from collections import OrderedDict
+from prometheus_client import Counter
+from srht.config import cfg
+from srht.database import db
+from todosrht.search import STATUS_ALIASES
+from todosrht.search import lookup_user, parse_search, resolve_users
+from todosrht.types import Label, Ticket, TicketAssignee, TicketLabel
+from todosrht.types import TicketStatus
+
+metrics = type("metrics", tuple(), {
+    c.describe()[0].name: c
+    for c in [
+        Counter("todosrht_bitmap_search", "Number of bitmap index searches"),
+        Counter("todosrht_bitmap_load", "Number of bitmap index full loads"),
+    ]
+})
+
+# Trackers with fewer tickets are searched with SQL
+threshold = int(cfg("todo.sr.ht", "bitmap-index-threshold", default=5000))
+# Number of tracker indexes kept by each process
+max_indexes = 64
+
+SORT_KEYS = ["created", "updated", "comments"]
+
+def _bitmap(rows):
+    """Returns a bitmap with the given rows set."""
+    if not rows:
+        return 0
+    data = bytearray(max(rows) // 8 + 1)
+    for row in rows:
+        data[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(data, "little")
+
+def _rows(bitmap):
+    """Returns the rows set in a bitmap, in ascending order."""
+    bits = bin(bitmap)[:1:-1]
+    return [row for row, bit in enumerate(bits) if bit == "1"]
+
+class TrackerIndex:
+    def __init__(self, tracker_id):
+        self.tracker_id = tracker_id
+        self.version = None
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.rows = dict()
+        self.tickets = list()
+        self.values = list()
+        self.sort_keys = {key: list() for key in SORT_KEYS}
+        self.statuses = dict()
+        self.labels = dict()
+        self.submitters = dict()
+        self.assignees = dict()
+        self.labelled = 0
+        self.assigned = 0
+
+    @property
+    def all(self):
+        return (1 << len(self.tickets)) - 1
+
+    def _query(self, since):
+        """
+        Loads the tickets of the tracker written after the given version, as
+        (ticket, label IDs, assignee IDs) tuples.
+        """
+        tickets = (db.session
+            .query(Ticket.id, Ticket.status, Ticket.submitter_id,
+                Ticket.created, Ticket.updated, Ticket.comment_count)
+            .filter(Ticket.tracker_id == self.tracker_id))
+        labels = (db.session
+            .query(TicketLabel.ticket_id, TicketLabel.label_id)
+            .join(Ticket, Ticket.id == TicketLabel.ticket_id)
+            .filter(Ticket.tracker_id == self.tracker_id))
+        assignees = (db.session
+            .query(TicketAssignee.ticket_id, TicketAssignee.assignee_id)
+            .join(Ticket, Ticket.id == TicketAssignee.ticket_id)
+            .filter(Ticket.tracker_id == self.tracker_id))
+        if since is not None:
+            tickets = tickets.filter(Ticket.tracker_version > since)
+            labels = labels.filter(Ticket.tracker_version > since)
+            assignees = assignees.filter(Ticket.tracker_version > since)
+
+        ticket_labels = dict()
+        for ticket_id, label_id in labels:
+            ticket_labels.setdefault(ticket_id, []).append(label_id)
+        ticket_assignees = dict()
+        for ticket_id, user_id in assignees:
+            ticket_assignees.setdefault(ticket_id, []).append(user_id)
+        return [(ticket,
+                ticket_labels.get(ticket.id, []),
+                ticket_assignees.get(ticket.id, []))
+            for ticket in tickets]
+
+    def load(self):
+        """Loads all tickets of the tracker, replacing the index."""
+        metrics.todosrht_bitmap_load.inc()
+        self._clear()
+        statuses = dict()
+        labels = dict()
+        submitters = dict()
+        assignees = dict()
+        labelled = list()
+        assigned = list()
+        for row, (ticket, label_ids, user_ids) in enumerate(self._query(None)):
+            self._append(ticket, label_ids, user_ids)
+            statuses.setdefault(int(ticket.status), []).append(row)
+            submitters.setdefault(ticket.submitter_id, []).append(row)
+            for label_id in label_ids:
+                labels.setdefault(label_id, []).append(row)
+            for user_id in user_ids:
+                assignees.setdefault(user_id, []).append(row)
+            if label_ids:
+                labelled.append(row)
+            if user_ids:
+                assigned.append(row)
+
+        self.statuses = {k: _bitmap(v) for k, v in statuses.items()}
+        self.labels = {k: _bitmap(v) for k, v in labels.items()}
+        self.submitters = {k: _bitmap(v) for k, v in submitters.items()}
+        self.assignees = {k: _bitmap(v) for k, v in assignees.items()}
+        self.labelled = _bitmap(labelled)
+        self.assigned = _bitmap(assigned)
+
+    def update(self):
+        """
+        Updates the index with the tickets written since it was last brought
+        up to date. Tickets may be loaded more than once.
+        """
+        for ticket, label_ids, user_ids in self._query(self.version):
+            row = self.rows.get(ticket.id)
+            if row is None:
+                row = self._append(ticket, label_ids, user_ids)
+            else:
+                self._unset(row)
+                self._store(row, ticket, label_ids, user_ids)
+            self._set(row)
+
+    def _append(self, ticket, label_ids, user_ids):
+        row = len(self.tickets)
+        self.rows[ticket.id] = row
+        self.tickets.append(ticket.id)
+        self.values.append(None)
+        for keys in self.sort_keys.values():
+            keys.append(None)
+        self._store(row, ticket, label_ids, user_ids)
+        return row
+
+    def _store(self, row, ticket, label_ids, user_ids):
+        self.values[row] = (int(ticket.status), ticket.submitter_id,
+                label_ids, user_ids)
+        self.sort_keys["created"][row] = ticket.created
+        self.sort_keys["updated"][row] = ticket.updated
+        self.sort_keys["comments"][row] = ticket.comment_count
+
+    def _set(self, row):
+        bit = 1 << row
+        status, submitter_id, label_ids, user_ids = self.values[row]
+        self.statuses[status] = self.statuses.get(status, 0) | bit
+        self.submitters[submitter_id] = (
+                self.submitters.get(submitter_id, 0) | bit)
+        for label_id in label_ids:
+            self.labels[label_id] = self.labels.get(label_id, 0) | bit
+        for user_id in user_ids:
+            self.assignees[user_id] = self.assignees.get(user_id, 0) | bit
+        if label_ids:
+            self.labelled |= bit
+        if user_ids:
+            self.assigned |= bit
+
+    def _unset(self, row):
+        mask = ~(1 << row)
+        status, submitter_id, label_ids, user_ids = self.values[row]
+        self.statuses[status] &= mask
+        self.submitters[submitter_id] &= mask
+        for label_id in label_ids:
+            self.labels[label_id] &= mask
+        for user_id in user_ids:
+            self.assignees[user_id] &= mask
+        self.labelled &= mask
+        self.assigned &= mask
+
+    def refresh(self, tracker):
+        """
+        Brings the index up to date with the tracker. Tickets are never
+        removed from an index, so it is reloaded if any ticket was deleted
+        from the tracker, or moved to another one, since it was last brought
+        up to date.
+        """
+        version = tracker.ticket_version
+        if version == self.version:
+            return
+        if self.version is None or tracker.removed_version > self.version:
+            self.load()
+        else:
+            self.update()
+        self.version = version
+
+    def _term_bitmap(self, term, users, labels, current_user):
+        """
+        Returns the bitmap of tickets matching a search term, ignoring its
+        inversion, or None if the term cannot be answered from the index.
+        """
+        if term.key == "status":
+            if term.value == "any":
+                return self.all
+            if term.value in STATUS_ALIASES:
+                bitmap = 0
+                for status in STATUS_ALIASES[term.value]:
+                    bitmap |= self.statuses.get(int(status), 0)
+                return bitmap
+            status = getattr(TicketStatus, term.value, None)
+            if not isinstance(status, TicketStatus):
+                return None
+            return self.statuses.get(int(status), 0)
+        elif term.key == "label":
+            return self.labels.get(labels.get(term.value), 0)
+        elif term.key == "no":
+            if term.value == "assignee":
+                return self.all & ~self.assigned
+            if term.value == "label":
+                return self.all & ~self.labelled
+            return None
+        elif term.key == "submitter":
+            _, participant_id = lookup_user(term.value, users, current_user)
+            return self.submitters.get(participant_id, 0)
+        elif term.key == "assigned":
+            user_id, _ = lookup_user(term.value, users, current_user)
+            return self.assignees.get(user_id, 0)
+        return None
+
+    def search(self, search_string, current_user):
+        """
+        Returns the IDs of the tickets matching a search, in order, or None
+        if the search has terms which the index cannot answer.
+        """
+        search_terms, sort_terms = parse_search(search_string)
+        if any(term.key not in ["status", "label", "no",
+                "submitter", "assigned"] for term in search_terms):
+            return None
+        if any(term.value.lstrip("-") not in SORT_KEYS
+                for term in sort_terms):
+            return None
+
+        users = resolve_users(search_terms, current_user)
+        names = [term.value for term in search_terms if term.key == "label"]
+        labels = dict()
+        if names:
+            labels = dict(db.session
+                .query(Label.name, Label.id)
+                .filter(Label.tracker_id == self.tracker_id)
+                .filter(Label.name.in_(names)))
+
+        result = self.all
+        for term in search_terms:
+            bitmap = self._term_bitmap(term, users, labels, current_user)
+            if bitmap is None:
+                return None
+            if term.inverse:
+                bitmap = self.all & ~bitmap
+            result &= bitmap
+
+        # Sorting by each key in turn, starting with the last one, orders the
+        # rows like ORDER BY does with several columns
+        rows = _rows(result)
+        for term in reversed(sort_terms):
+            keys = self.sort_keys[term.value.lstrip("-")]
+            rows.sort(key=keys.__getitem__, reverse=term.key == "sort")
+        return [self.tickets[row] for row in rows]
+
+    def facet_counts(self, ids):
+        """
+        Counts the given tickets by status, label and assignee, in the form
+        expected by search.resolve_facets.
+        """
+        result = _bitmap([self.rows[id] for id in ids if id in self.rows])
+        def count(bitmaps):
+            counts = dict()
+            for key, bitmap in bitmaps.items():
+                n = bin(bitmap & result).count("1")
+                if n:
+                    counts[key] = n
+            return counts
+        return {
+            "status": count(self.statuses),
+            "label": count(self.labels),
+            "assignee": count(self.assignees),
+        }
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def _get_index(tracker_id):
+    with _indexes_lock:
+        index = _indexes.pop(tracker_id, None)
+        if index is None:
+            index = TrackerIndex(tracker_id)
+        _indexes[tracker_id] = index
+        while len(_indexes) > max_indexes:
+            _indexes.popitem(last=False)
+        return index
+
+def search_tracker(tracker, search_string, current_user):
+    """
+    Returns the IDs of the tickets of a tracker matching a search, in order,
+    or None if the tracker is too small to be indexed or the search needs
+    SQL. Access is not checked, so this may only be used for viewers who can
+    browse every ticket of the tracker.
+    """
+    if tracker.open_ticket_count + tracker.closed_ticket_count < threshold:
+        return None
+    index = _get_index(tracker.id)
+    with index.lock:
+        index.refresh(tracker)
+        ids = index.search(search_string, current_user)
+    if ids is not None:
+        metrics.todosrht_bitmap_search.inc()
+    return ids
+
+def tracker_facet_counts(tracker, ids):
+    """
+    Counts the tickets found by search_tracker by status, label and assignee,
+    like search.count_facets.
+    """
+    index = _get_index(tracker.id)
+    with index.lock:
+        return index.facet_counts(ids)
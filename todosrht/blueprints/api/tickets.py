@@ -1,3 +1,4 @@
+import sqlalchemy as sa
 from datetime import datetime, timezone
 from flask import Blueprint, current_app, abort, request
 from srht.api import paginated_response
@@ -6,13 +7,18 @@ from srht.graphql import exec_gql
 from srht.oauth import oauth, current_token
 from srht.validation import Validation, valid_url
 from todosrht.access import get_tracker, get_ticket
-from todosrht.tickets import add_comment
+from todosrht.conditional import add_validators, make_etag, not_modified
+from todosrht.conditional import tracker_state
+from todosrht.search import apply_search
+from todosrht.tickets import add_comment, assign, change_labels
 from todosrht.tickets import get_participant_for_user, get_participant_for_external
 from todosrht.blueprints.api import get_user
+from todosrht.serialize import serialize, json_response, ndjson_response
+from todosrht.serialize import requested_fields, field_options
 from todosrht.types import Ticket, TicketAccess, TicketStatus, TicketResolution
-from todosrht.types import Event, EventType, Label, TicketLabel, TicketComment
-from todosrht.types import TicketAuthenticity, ParticipantType
-from todosrht.webhooks import TrackerWebhook, TicketWebhook
+from todosrht.types import Event, Label, TicketComment, User
+from todosrht.types import TicketAuthenticity, Participant, ParticipantType
+from todosrht.webhooks import TrackerWebhook, TicketWebhook, WebhookBatch
 
 tickets = Blueprint("api_tickets", __name__)
 
@@ -27,10 +33,56 @@ def tracker_tickets_GET(username, tracker_name):
         abort(404)
     if not TicketAccess.browse in access:
         abort(401)
+    valid = Validation(request)
+    fields = requested_fields(valid, Ticket)
+    if not valid.ok:
+        return valid.response
+    state, last_modified = tracker_state(tracker)
+    etag = make_etag(state, request.full_path, access)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
     tickets = (Ticket.query
         .filter(Ticket.tracker_id == tracker.id)
+        .options(*field_options(Ticket, fields))
         .order_by(Ticket.scoped_id.desc()))
-    return paginated_response(Ticket.scoped_id, tickets)
+    return add_validators(paginated_response(Ticket.scoped_id, tickets,
+            serialize=lambda t: t.to_dict(fields=fields)), etag, last_modified)
+
+# Number of rows loaded at a time when exporting
+export_batch_size = 500
+
+def _export_tickets(tracker):
+    """
+    Yields every ticket on the tracker in order, with everything to_dict()
+    uses loaded a batch at a time. Collections cannot be eagerly loaded into
+    a yield_per query, so each batch is its own query instead.
+    """
+    last_id = 0
+    while True:
+        batch = (Ticket.query
+            .filter(Ticket.tracker_id == tracker.id)
+            .filter(Ticket.scoped_id > last_id)
+            .options(*field_options(Ticket))
+            .order_by(Ticket.scoped_id)
+            .limit(export_batch_size)).all()
+        yield from batch
+        if len(batch) < export_batch_size:
+            break
+        last_id = batch[-1].scoped_id
+
+@tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets/export")
+@tickets.route("/api/trackers/<tracker_name>/tickets/export",
+        defaults={"username": None})
+@oauth("tickets:read")
+def tracker_tickets_export_GET(username, tracker_name):
+    user = get_user(username)
+    tracker, access = get_tracker(user, tracker_name, user=current_token.user)
+    if not tracker:
+        abort(404)
+    if not TicketAccess.browse in access:
+        abort(401)
+    return ndjson_response(_export_tickets(tracker))
 
 @tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets",
         methods=["POST"])
@@ -101,10 +153,11 @@ def tracker_tickets_POST(username, tracker_name):
 
     ticket, _ = get_ticket(tracker, resp["submitTicket"]["id"])
 
-    TrackerWebhook.deliver(TrackerWebhook.Events.ticket_create,
-            ticket.to_dict(),
-            TrackerWebhook.Subscription.tracker_id == tracker.id)
-    return ticket.to_dict(), 201
+    webhooks = WebhookBatch()
+    webhooks.add(TrackerWebhook, TrackerWebhook.Events.ticket_create,
+            serialize(ticket), tracker.id)
+    webhooks.deliver()
+    return json_response(serialize(ticket), 201)
 
 @tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets/<int:ticket_id>")
 @tickets.route("/api/trackers/<tracker_name>/tickets/<int:ticket_id>",
@@ -118,7 +171,18 @@ def tracker_ticket_by_id_GET(username, tracker_name, ticket_id):
     ticket, access = get_ticket(tracker, ticket_id, user=current_token.user)
     if not TicketAccess.browse in access:
         abort(401)
-    return ticket.to_dict()
+    valid = Validation(request)
+    fields = requested_fields(valid, Ticket)
+    if not valid.ok:
+        return valid.response
+    state, updated = tracker_state(tracker, tickets=False)
+    etag = make_etag(state, ticket.id, ticket.updated,
+            request.full_path, access)
+    last_modified = max(updated, ticket.updated)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+    return add_validators(ticket.to_dict(fields=fields), etag, last_modified)
 
 def _webhook_filters(query, username, tracker_name, ticket_id):
     user = get_user(username)
@@ -147,6 +211,13 @@ TicketWebhook.api_routes(tickets,
         "/api/user/<username>/trackers/<tracker_name>/tickets/<int:ticket_id>",
         filters=_webhook_filters, create=_webhook_create)
 
+def _add_event_webhooks(webhooks, ticket, event, memo=True):
+    payload = serialize(event, memo=memo)
+    webhooks.add(TicketWebhook, TicketWebhook.Events.event_create,
+            payload, ticket.id)
+    webhooks.add(TrackerWebhook, TrackerWebhook.Events.event_create,
+            payload, ticket.tracker_id)
+
 @tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets/<int:ticket_id>",
         methods=["PUT"])
 @tickets.route("/api/trackers/<tracker_name>/tickets/<int:ticket_id>",
@@ -192,8 +263,9 @@ def tracker_ticket_by_id_PUT(username, tracker_name, ticket_id):
     required_access = TicketAccess.none
     comment = resolution = None
     resolve = reopen = False
-    labels = None
+    to_add = to_remove = []
     events = list()
+    webhooks = WebhookBatch()
     if "comment" in valid:
         required_access |= TicketAccess.comment
         comment = valid.optional("comment")
@@ -217,60 +289,16 @@ def tracker_ticket_by_id_PUT(username, tracker_name, ticket_id):
                 "Expected array of strings", field="labels")
         if not valid.ok:
             return valid.response
-        have = set(label.name for label in ticket.labels)
+        have = {label.name: label for label in ticket.labels}
         want = set(labels)
-        to_remove = have - want
-        to_add = want - have
-        for name in to_remove:
-            label = (Label.query
-                    .filter(Label.tracker_id == tracker.id)
-                    .filter(Label.name == name)).one_or_none()
-            (TicketLabel.query
-                    .filter(TicketLabel.ticket_id == ticket.id)
-                    .filter(TicketLabel.label_id == label.id)).delete()
-            event = Event()
-            event.event_type = EventType.label_removed
-            event.participant_id = participant.id
-            event.ticket_id = ticket.id
-            event.label_id = label.id
-            db.session.add(event)
-            db.session.flush()
-            TicketWebhook.deliver(TicketWebhook.Events.event_create,
-                    event.to_dict(),
-                    TicketWebhook.Subscription.ticket_id == ticket.id)
-            TrackerWebhook.deliver(TrackerWebhook.Events.event_create,
-                    event.to_dict(),
-                    TrackerWebhook.Subscription.tracker_id == ticket.tracker_id)
-            events.append(event)
-        for name in to_add:
-            label = (Label.query
+        to_remove = [have[name] for name in have.keys() - want]
+        to_add = []
+        if want - have.keys():
+            to_add = (Label.query
                     .filter(Label.tracker_id == tracker.id)
-                    .filter(Label.name == name)).one_or_none()
-            valid.expect(label is not None,
-                    f"Unknown label {name}", field="labels")
-            if not valid.ok:
-                return valid.response
-            tl = TicketLabel()
-            tl.ticket_id = ticket.id
-            tl.label_id = label.id
-            tl.user_id = current_token.user_id
-            db.session.add(tl)
-            event = Event()
-            event.event_type = EventType.label_added
-            event.participant_id = participant.id
-            event.ticket_id = ticket.id
-            event.label_id = label.id
-            db.session.add(event)
-            db.session.flush()
-            TicketWebhook.deliver(TicketWebhook.Events.event_create,
-                    event.to_dict(),
-                    TicketWebhook.Subscription.ticket_id == ticket.id)
-            TrackerWebhook.deliver(TrackerWebhook.Events.event_create,
-                    event.to_dict(),
-                    TrackerWebhook.Subscription.tracker_id == ticket.tracker_id)
-            events.append(event)
-        if not valid.ok:
-            return valid.response
+                    .filter(Label.name.in_(want - have.keys()))).all()
+        for name in want - have.keys() - {l.name for l in to_add}:
+            valid.error(f"Unknown label {name}", field="labels")
 
     if not valid.ok:
         return valid.response
@@ -278,6 +306,11 @@ def tracker_ticket_by_id_PUT(username, tracker_name, ticket_id):
     if access & required_access != required_access:
         abort(401)
 
+    for event in change_labels(ticket, participant, current_token.user,
+            add=to_add, remove=to_remove):
+        _add_event_webhooks(webhooks, ticket, event)
+        events.append(event)
+
     if comment or resolve or resolution or reopen:
         event = add_comment(participant, ticket,
                 comment, resolve, resolution, reopen)
@@ -290,18 +323,131 @@ def tracker_ticket_by_id_PUT(username, tracker_name, ticket_id):
         db.session.add(event)
         db.session.flush()
         events.append(event)
-        TicketWebhook.deliver(TicketWebhook.Events.event_create,
-                event.to_dict(),
-                TicketWebhook.Subscription.ticket_id == ticket.id)
-        TrackerWebhook.deliver(TrackerWebhook.Events.event_create,
-                event.to_dict(),
-                TrackerWebhook.Subscription.tracker_id == ticket.tracker_id)
+        _add_event_webhooks(webhooks, ticket, event)
 
     db.session.commit()
+    webhooks.deliver()
+
+    # Events are already serialized for the webhooks
+    return json_response(b'{"ticket":' + serialize(ticket) +
+        b',"events":[' + b",".join(serialize(e) for e in events) + b']}')
+
+bulk_operations = ["resolve", "reopen", "label", "unlabel", "assign"]
+bulk_batch_size = 100
+
+def _bulk_apply(ticket, participant, operation, resolution, labels, assignee):
+    """Applies a bulk operation to a ticket and returns the events created."""
+    if operation == "resolve":
+        event = add_comment(participant, ticket,
+                resolve=True, resolution=resolution, commit=False)
+    elif operation == "reopen":
+        event = add_comment(participant, ticket, reopen=True, commit=False)
+    elif operation == "label":
+        return change_labels(ticket, participant, current_token.user,
+                add=[l for l in labels if l not in ticket.labels])
+    elif operation == "unlabel":
+        return change_labels(ticket, participant, current_token.user,
+                remove=[l for l in labels if l in ticket.labels])
+    elif operation == "assign":
+        if assignee in ticket.assigned_users:
+            return []
+        event = assign(ticket, assignee, current_token.user)
+    return [event] if event else []
+
+@tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets/bulk",
+        methods=["POST"])
+@tickets.route("/api/trackers/<tracker_name>/tickets/bulk",
+        defaults={"username": None}, methods=["POST"])
+@oauth("tickets:write")
+def tracker_tickets_bulk_POST(username, tracker_name):
+    user = get_user(username)
+    tracker, access = get_tracker(user, tracker_name, user=current_token.user)
+    if not tracker:
+        abort(404)
+    if not TicketAccess.triage in access:
+        abort(401)
+
+    valid = Validation(request)
+    operation = valid.require("operation")
+    valid.expect(not operation or operation in bulk_operations,
+            f"Expected one of {', '.join(bulk_operations)}",
+            field="operation")
+    search = valid.optional("search")
+    ticket_ids = valid.optional("tickets", cls=list)
+    valid.expect((search is None) != (ticket_ids is None),
+            "Specify either a search string or a list of tickets, not both.")
+    valid.expect(ticket_ids is None
+            or all(isinstance(x, int) for x in ticket_ids),
+            "Expected array of ticket IDs", field="tickets")
+    if not valid.ok:
+        return valid.response
+
+    resolution = labels = assignee = None
+    if operation == "resolve":
+        resolution = valid.require("resolution", cls=TicketResolution)
+    elif operation in ["label", "unlabel"]:
+        names = valid.require("labels", cls=list)
+        valid.expect(not names or all(isinstance(x, str) for x in names),
+                "Expected array of strings", field="labels")
+        if not valid.ok:
+            return valid.response
+        labels = (Label.query
+                .filter(Label.tracker_id == tracker.id)
+                .filter(Label.name.in_(names))).all()
+        for name in set(names) - {l.name for l in labels}:
+            valid.error(f"Unknown label {name}", field="labels")
+    elif operation == "assign":
+        assignee_name = valid.require("assignee")
+        if assignee_name:
+            assignee = (User.query
+                    .filter(User.username == assignee_name.lstrip("~"))
+                    .one_or_none())
+            valid.expect(assignee is not None,
+                    f"Unknown user {assignee_name}", field="assignee")
+
+    tickets = Ticket.query.filter(Ticket.tracker_id == tracker.id)
+    if search is not None:
+        try:
+            tickets = apply_search(tickets, search, current_token.user)
+        except ValueError as ex:
+            valid.error(str(ex), field="search")
+    else:
+        tickets = tickets.filter(Ticket.scoped_id.in_(ticket_ids))
+    if not valid.ok:
+        return valid.response
+    # Search filters may join, so drop duplicates while keeping the order
+    ids = list(dict.fromkeys(
+        row.id for row in tickets.with_entities(Ticket.id)))
+
+    participant = get_participant_for_user(current_token.user)
+    changed = list()
+    # Each batch is committed, and its webhooks delivered, before the next one
+    # is loaded, so that a large operation does not hold its locks or its
+    # objects for the whole request.
+    for i in range(0, len(ids), bulk_batch_size):
+        batch = ids[i:i+bulk_batch_size]
+        webhooks = WebhookBatch()
+        for ticket in (Ticket.query
+                .filter(Ticket.id.in_(batch))
+                .options(sa.orm.selectinload(Ticket.labels))
+                .options(sa.orm.selectinload(Ticket.assigned_users))
+                .order_by(Ticket.id)):
+            events = _bulk_apply(ticket, participant,
+                    operation, resolution, labels, assignee)
+            if not events:
+                continue
+            db.session.flush()
+            for event in events:
+                _add_event_webhooks(webhooks, ticket, event, memo=False)
+            changed.append(ticket.scoped_id)
+        db.session.commit()
+        webhooks.deliver()
 
     return {
-        "ticket": ticket.to_dict(),
-        "events": [event.to_dict() for event in events],
+        "operation": operation,
+        "matched": len(ids),
+        "changed": len(changed),
+        "tickets": sorted(changed),
     }
 
 @tickets.route("/api/user/<username>/trackers/<tracker_name>/tickets/<int:ticket_id>/comments/<int:comment_id>",
@@ -352,6 +498,7 @@ def tracker_comment_by_id_PUT(username, tracker_name, ticket_id, comment_id):
 
     comment.superceeded_by_id = new_comment.id
     event.comment_id = new_comment.id
+    ticket.updated = datetime.utcnow()
     db.session.commit()
     return new_comment.to_dict()
 
@@ -370,4 +517,42 @@ def tracker_ticket_by_id_events_GET(username, tracker_name, ticket_id):
     if not TicketAccess.browse in access:
         abort(401)
     events = Event.query.filter(Event.ticket_id == ticket.id)
-    return paginated_response(Event.id, events)
+    # Mentions of this ticket add events without updating it
+    last_event = events.with_entities(sa.func.max(Event.id)).scalar()
+    etag = make_etag(ticket.id, ticket.updated, last_event,
+            request.full_path, access)
+    response = not_modified(etag, ticket.updated)
+    if response:
+        return response
+    return add_validators(paginated_response(Event.id, events),
+            etag, ticket.updated)
+
+@tickets.route("/api/user/<username>/trackers/<tracker_name>/events/export")
+@tickets.route("/api/trackers/<tracker_name>/events/export",
+        defaults={"username": None})
+@oauth("tickets:read")
+def tracker_events_export_GET(username, tracker_name):
+    """
+    Streams every event on the tracker's tickets in order. Pass the ID of the
+    last event received as ?since= to resume from there.
+    """
+    user = get_user(username)
+    tracker, access = get_tracker(user, tracker_name, user=current_token.user)
+    if not tracker:
+        abort(404)
+    if not TicketAccess.browse in access:
+        abort(401)
+    since = request.args.get("since", type=int, default=0)
+    events = (Event.query
+        .join(Ticket, Event.ticket_id == Ticket.id)
+        .filter(Ticket.tracker_id == tracker.id)
+        .filter(Event.id > since)
+        .options(
+            sa.orm.contains_eager(Event.ticket),
+            sa.orm.joinedload(Event.participant).joinedload(Participant.user),
+            sa.orm.joinedload(Event.comment),
+            sa.orm.joinedload(Event.label))
+        .order_by(Event.id)
+        .execution_options(stream_results=True)
+        .yield_per(export_batch_size))
+    return ndjson_response(events)
@@ -5,7 +5,9 @@ from srht.graphql import exec_gql
 from srht.oauth import oauth, current_token
 from srht.validation import Validation
 from todosrht.access import get_tracker
+from todosrht.conditional import add_validators, make_etag, not_modified
 from todosrht.blueprints.api import get_user
+from todosrht.serialize import requested_fields, field_options
 from todosrht.tickets import get_participant_for_user
 from todosrht.types import Label, Tracker, TicketAccess, TicketSubscription
 from todosrht.webhooks import TrackerWebhook
@@ -17,11 +19,18 @@ trackers = Blueprint("api_trackers", __name__)
 @oauth("trackers:read")
 def user_trackers_GET(username):
     user = get_user(username)
-    trackers = Tracker.query.filter(Tracker.owner_id == user.id)
+    valid = Validation(request)
+    fields = requested_fields(valid, Tracker)
+    if not valid.ok:
+        return valid.response
+    trackers = (Tracker.query
+        .filter(Tracker.owner_id == user.id)
+        .options(*field_options(Tracker, fields)))
     if current_token.user_id != user.id:
         # TODO: proper ACLs
         trackers = trackers.filter(Tracker.default_access > 0)
-    return paginated_response(Tracker.id, trackers)
+    return paginated_response(Tracker.id, trackers,
+            serialize=lambda t: t.to_dict(fields=fields))
 
 @trackers.route("/api/trackers", methods=["POST"])
 @oauth("trackers:write")
@@ -85,7 +94,20 @@ def user_tracker_by_name_GET(username, tracker_name):
         abort(404)
     if not TicketAccess.browse in access:
         abort(401)
-    return tracker.to_dict()
+    valid = Validation(request)
+    fields = requested_fields(valid, Tracker)
+    if not valid.ok:
+        return valid.response
+    # The ticket counts change with the ticket version
+    etag = make_etag(tracker.id, tracker.updated, tracker.ticket_version,
+            request.full_path, access)
+    last_modified = max(u for u in [tracker.updated, tracker.ticket_updated]
+            if u)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+    return add_validators(tracker.to_dict(fields=fields),
+            etag, last_modified)
 
 def _webhook_filters(query, username, tracker_name):
     user = get_user(username)
@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, request, abort, redirect, url_for
-from todosrht.access import get_tracker, get_access
+from todosrht.access import browsable_trackers, get_tracker, get_access
+from todosrht.savedsearches import get_saved_searches
+from todosrht.search import apply_search, paginate_capped
 from todosrht.tickets import get_participant_for_user
 from todosrht.types import Tracker, Ticket, TicketAccess, Visibility
 from todosrht.types import Event, EventNotification, EventType
@@ -10,6 +12,7 @@ from srht.oauth import current_user, loginrequired
 from srht.flask import paginate_query, session
 from srht.validation import Validation
 from sqlalchemy import and_, or_
+import sqlalchemy as sa
 
 html = Blueprint('html', __name__)
 
@@ -35,12 +38,17 @@ def index_GET():
     total_trackers = trackers.count()
     trackers = trackers.limit(limit_trackers).all()
 
+    # Walks event_notification_user_id_created, newest first, and only
+    # fetches the events it needs from the event table.
     events = (Event.query
             .join(EventNotification)
             .filter(EventNotification.user_id == current_user.id)
-            .order_by(Event.created.desc()))
+            .order_by(EventNotification.created.desc(),
+                EventNotification.event_id.desc()))
     events = events.limit(10).all()
 
+    saved_searches = get_saved_searches(current_user)
+
     notice = session.pop("notice", None)
     prefs_updated = session.pop("prefs_updated", None)
 
@@ -48,6 +56,7 @@ def index_GET():
         trackers=trackers, notice=notice,
         tracker_list_msg="Your Trackers",
         more_trackers=total_trackers > limit_trackers,
+        saved_searches=saved_searches,
         events=events, EventType=EventType,
         prefs_updated=prefs_updated)
 
@@ -115,3 +124,36 @@ def trackers_for_user(username):
 
     return render_template("trackers.html",
             user=user, trackers=trackers, search=search, **pagination)
+
+# Searches across trackers may match a very large number of tickets, which are
+# not worth counting exactly
+search_max_results = 1000
+
+@html.route("/search")
+@loginrequired
+def search_GET():
+    terms = request.args.get("search")
+    include_public = bool(request.args.get("public"))
+
+    # Access is checked with a single subquery of the trackers the user can
+    # browse, rather than tracker by tracker
+    trackers = browsable_trackers(current_user, include_public)
+    tickets = (Ticket.query
+        .filter(Ticket.tracker_id.in_(trackers))
+        .options(sa.orm.joinedload(Ticket.tracker)
+            .joinedload(Tracker.owner))
+        .options(sa.orm.joinedload(Ticket.submitter))
+        .options(sa.orm.selectinload(Ticket.labels)))
+
+    search_error = None
+    try:
+        tickets = apply_search(tickets, terms, current_user)
+    except ValueError as e:
+        search_error = str(e)
+
+    tickets, pagination = paginate_capped(tickets, results_per_page=25,
+            max_results=search_max_results)
+
+    return render_template("search.html", tickets=tickets, search=terms,
+            include_public=include_public, search_error=search_error,
+            **pagination)
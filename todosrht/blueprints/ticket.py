@@ -1,4 +1,5 @@
 import re
+import sqlalchemy as sa
 from datetime import datetime
 from flask import Blueprint, current_app, render_template, request, abort, redirect
 from srht.config import cfg
@@ -8,6 +9,8 @@ from srht.graphql import exec_gql
 from srht.oauth import current_user, loginrequired
 from srht.validation import Validation
 from todosrht.access import get_tracker, get_ticket
+from todosrht.conditional import add_validators, make_etag, not_modified
+from todosrht.conditional import cached_page, tracker_state
 from todosrht.filters import render_markup
 from todosrht.search import find_usernames
 from todosrht.tickets import add_comment, assign, unassign
@@ -16,7 +19,7 @@ from todosrht.trackers import get_recent_users
 from todosrht.types import Event, EventType, Label, TicketLabel
 from todosrht.types import TicketAccess, TicketResolution, ParticipantType
 from todosrht.types import TicketComment, TicketAuthenticity
-from todosrht.types import TicketSubscription, User, Participant
+from todosrht.types import TicketSubscription, User, Participant, Visibility
 from todosrht.urls import tracker_url, ticket_url
 from urllib.parse import quote
 
@@ -34,26 +37,31 @@ to the entire {tracker_ref} tracker.
 You can unsubscribe at any time by mailing <{ticket_email_ref}/unsubscribe@""" + \
     posting_domain + ">.\n"
 
-def get_ticket_context(ticket, tracker, access):
+def _get_subscriptions(ticket, tracker):
+    """Returns the current user's tracker and ticket subscriptions"""
+    if not current_user:
+        return None, None
+    tracker_sub = (TicketSubscription.query
+            .join(Participant)
+            .filter(TicketSubscription.ticket_id == None)
+            .filter(TicketSubscription.tracker_id == tracker.id)
+            .filter(Participant.user_id == current_user.id)
+        ).one_or_none()
+    ticket_sub = (TicketSubscription.query
+            .join(Participant)
+            .filter(TicketSubscription.ticket_id == ticket.id)
+            .filter(TicketSubscription.tracker_id == None)
+            .filter(Participant.user_id == current_user.id)
+        ).one_or_none()
+    return tracker_sub, ticket_sub
+
+def get_ticket_context(ticket, tracker, access, subscriptions=None):
     """Returns the context required to render ticket.html"""
-    tracker_sub = None
-    ticket_sub = None
+    tracker_sub, ticket_sub = subscriptions or \
+            _get_subscriptions(ticket, tracker)
     ticket_subscribe = None
 
-    if current_user:
-        tracker_sub = (TicketSubscription.query
-                .join(Participant)
-                .filter(TicketSubscription.ticket_id == None)
-                .filter(TicketSubscription.tracker_id == tracker.id)
-                .filter(Participant.user_id == current_user.id)
-            ).one_or_none()
-        ticket_sub = (TicketSubscription.query
-                .join(Participant)
-                .filter(TicketSubscription.ticket_id == ticket.id)
-                .filter(TicketSubscription.tracker_id == None)
-                .filter(Participant.user_id == current_user.id)
-            ).one_or_none()
-    else:
+    if not current_user:
         subj = quote("Subscribing to " + ticket.ref())
         ticket_subscribe = f"mailto:{ticket.ref(email=True)}/subscribe@" + \
             f"{posting_domain}?subject={subj}&body=" + \
@@ -88,8 +96,29 @@ def ticket_GET(owner, name, ticket_id):
     if not ticket:
         abort(404)
 
-    ctx = get_ticket_context(ticket, tracker, access)
-    return render_template("ticket.html", **ctx)
+    # Recently active users are only listed for triage, and change with
+    # activity anywhere on the tracker.
+    state, updated = tracker_state(tracker,
+            tickets=TicketAccess.triage in access)
+    subscriptions = _get_subscriptions(ticket, tracker)
+    # Mentions of this ticket add events without updating it
+    last_event = (db.session.query(sa.func.max(Event.id))
+        .filter(Event.ticket_id == ticket.id)).scalar()
+    etag = make_etag(state, ticket.id, ticket.updated, last_event, access,
+            current_user.id if current_user else None,
+            [sub.id if sub else None for sub in subscriptions])
+    last_modified = max(updated, ticket.updated)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+
+    render = lambda: render_template("ticket.html",
+            **get_ticket_context(ticket, tracker, access, subscriptions))
+    if not current_user and tracker.visibility == Visibility.PUBLIC:
+        page = cached_page(etag, render)
+    else:
+        page = render()
+    return add_validators(page, etag, last_modified)
 
 @ticket.route("/<owner>/<name>/<int:ticket_id>/enable_notifications", methods=["POST"])
 @loginrequired
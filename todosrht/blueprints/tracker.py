@@ -6,15 +6,20 @@ from srht.graphql import exec_gql
 from srht.oauth import current_user, loginrequired
 from srht.validation import Validation
 from todosrht.access import get_tracker, get_ticket
+from todosrht.bitmaps import search_tracker, tracker_facet_counts
+from todosrht.conditional import add_validators, make_etag, not_modified
+from todosrht.conditional import cached_page, tracker_state
 from todosrht.color import color_from_hex, color_to_hex, get_text_color
 from todosrht.color import valid_hex_color_code
 from todosrht.filters import render_markup
-from todosrht.search import apply_search
+from todosrht.search import apply_search, count_facets, load_tickets
+from todosrht.search import paginate_ids, requested_page, resolve_facets
+from todosrht.searchcache import get_results, search_key, set_results
 from todosrht.tickets import get_participant_for_user
-from todosrht.types import Event, Label, TicketLabel
+from todosrht.types import Event, Label, SavedSearch, TicketLabel
 from todosrht.types import TicketSubscription, Participant
-from todosrht.types import Tracker, Ticket, TicketAccess
-from todosrht.urls import tracker_url, ticket_url
+from todosrht.types import Tracker, Ticket, TicketAccess, Visibility
+from todosrht.urls import tracker_url, ticket_url, tracker_search_url
 from urllib.parse import quote
 import sqlalchemy as sa
 
@@ -73,21 +78,25 @@ def create_POST():
         owner=resp["owner"]["canonicalName"],
         name=resp["name"]))
 
-def return_tracker(tracker, access, **kwargs):
+def _is_subscribed(tracker):
+    if not current_user:
+        return False
+    sub = (TicketSubscription.query
+        .join(Participant)
+        .filter(TicketSubscription.tracker_id == tracker.id)
+        .filter(TicketSubscription.ticket_id == None)
+        .filter(Participant.user_id == current_user.id)
+    ).one_or_none()
+    return bool(sub)
+
+def return_tracker(tracker, access, is_subscribed=None, **kwargs):
     another = session.get("another") or False
     if another:
         del session["another"]
-    is_subscribed = False
+    if is_subscribed is None:
+        is_subscribed = _is_subscribed(tracker)
     tracker_subscribe = None
-    if current_user:
-        sub = (TicketSubscription.query
-            .join(Participant)
-            .filter(TicketSubscription.tracker_id == tracker.id)
-            .filter(TicketSubscription.ticket_id == None)
-            .filter(Participant.user_id == current_user.id)
-        ).one_or_none()
-        is_subscribed = bool(sub)
-    else:
+    if not current_user:
         subj = quote("Subscribing to " + tracker.ref())
         tracker_subscribe = f"mailto:{tracker.ref()}/subscribe@" + \
             f"{posting_domain}?subject={subj}&body=" + \
@@ -103,15 +112,45 @@ def return_tracker(tracker, access, **kwargs):
     else:
         tickets = Ticket.query.filter(False)
 
-    try:
-        terms = request.args.get("search")
-        tickets = apply_search(tickets, terms, current_user)
-    except ValueError as e:
-        kwargs["search_error"] = str(e)
-
-    tickets = tickets.options(sa.orm.joinedload(Ticket.submitter))
-
-    tickets, pagination = paginate_query(tickets, results_per_page=25)
+    terms = request.args.get("search")
+    key = search_key(tracker, terms, access, current_user,
+            requested_page(), results_per_page=25)
+    results = get_results(key) if key else None
+    if results:
+        ids, pagination, facet_counts = results
+        tickets = load_tickets(
+                tickets.options(sa.orm.joinedload(Ticket.submitter)), ids)
+    else:
+        # Large trackers are searched with their bitmap index, where possible
+        ids = None
+        try:
+            if TicketAccess.browse in access:
+                ids = search_tracker(tracker, terms, current_user)
+            if ids is None:
+                tickets = apply_search(tickets, terms, current_user)
+        except ValueError as e:
+            kwargs["search_error"] = str(e)
+
+        # Searches show how their results break down, to help narrow them
+        facet_counts = None
+        if terms and "search_error" not in kwargs:
+            if ids is not None:
+                facet_counts = tracker_facet_counts(tracker, ids)
+            else:
+                facet_counts = count_facets(tickets)
+
+        tickets = tickets.options(sa.orm.joinedload(Ticket.submitter))
+
+        if ids is not None:
+            tickets, pagination = paginate_ids(tickets, ids,
+                    results_per_page=25)
+        else:
+            tickets, pagination = paginate_query(tickets, results_per_page=25)
+
+        if key and "search_error" not in kwargs:
+            set_results(key, [t.id for t in tickets], pagination, facet_counts)
+
+    facets = resolve_facets(facet_counts) if facet_counts else None
 
     if "another" in kwargs:
         another = kwargs["another"]
@@ -120,7 +159,8 @@ def return_tracker(tracker, access, **kwargs):
     return render_template("tracker.html",
             tracker=tracker, another=another, tickets=tickets,
             access=access, is_subscribed=is_subscribed, search=terms,
-            tracker_subscribe=tracker_subscribe, **pagination, **kwargs)
+            facets=facets, tracker_subscribe=tracker_subscribe,
+            **pagination, **kwargs)
 
 @tracker.route("/<owner>/<name>")
 def tracker_GET(owner, name):
@@ -135,7 +175,29 @@ def tracker_GET(owner, name):
         "notice": session.pop("notice", None),
     }
 
-    return return_tracker(tracker, access, **kwargs)
+    # One-off notices are kept in the session, so these pages are always
+    # rendered in full.
+    if kwargs["notice"] or session.get("another"):
+        return return_tracker(tracker, access, **kwargs)
+
+    state, last_modified = tracker_state(tracker)
+    is_subscribed = _is_subscribed(tracker)
+    # Equivalent spellings of a page share its ETag and cached copy
+    args = sorted((k, v) for k, v in request.args.items(multi=True)
+        if k != "page")
+    etag = make_etag(state, request.path, args, requested_page(), access,
+            current_user.id if current_user else None, is_subscribed)
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+
+    render = lambda: return_tracker(tracker, access,
+            is_subscribed=is_subscribed, **kwargs)
+    if not current_user and tracker.visibility == Visibility.PUBLIC:
+        page = cached_page(etag, render)
+    else:
+        page = render()
+    return add_validators(page, etag, last_modified)
 
 @tracker.route("/<owner>/<name>/enable_notifications", methods=["POST"])
 @loginrequired
@@ -182,17 +244,77 @@ def disable_notifications(owner, name):
     db.session.commit()
     return redirect(tracker_url(tracker))
 
+@tracker.route("/<owner>/<name>/searches", methods=["POST"])
+@loginrequired
+def saved_search_POST(owner, name):
+    tracker, access = get_tracker(owner, name)
+    if not tracker:
+        abort(404)
+    if not TicketAccess.browse in access:
+        abort(403)
+
+    valid = Validation(request)
+    search_name = valid.require("name", friendly_name="Name")
+    search = valid.require("search", friendly_name="Search")
+    # The search being saved is listed from the URL, like on tracker_GET
+    render = lambda: return_tracker(tracker, access, **{
+        k: v for k, v in valid.kwargs.items() if k != "search"})
+    if not valid.ok:
+        return render(), 400
+
+    valid.expect(len(search_name) <= 128,
+            "Name must be no more than 128 characters", field="name")
+    valid.expect(len(search) <= 2048,
+            "Search must be no more than 2048 characters", field="search")
+    try:
+        apply_search(Ticket.query, search, current_user)
+    except ValueError as e:
+        valid.error(str(e), field="search")
+    valid.expect(not SavedSearch.query
+            .filter(SavedSearch.user_id == current_user.id)
+            .filter(SavedSearch.tracker_id == tracker.id)
+            .filter(SavedSearch.name == search_name).count(),
+            "You already have a saved search with this name", field="name")
+    if not valid.ok:
+        return render(), 400
+
+    saved = SavedSearch()
+    saved.user_id = current_user.id
+    saved.tracker_id = tracker.id
+    saved.name = search_name
+    saved.search = search
+    db.session.add(saved)
+    db.session.commit()
+    return redirect(tracker_search_url(tracker, search))
+
+@tracker.route("/<owner>/<name>/searches/<int:search_id>/delete",
+        methods=["POST"])
+@loginrequired
+def saved_search_delete_POST(owner, name, search_id):
+    tracker, access = get_tracker(owner, name)
+    if not tracker:
+        abort(404)
+
+    saved = (SavedSearch.query
+        .filter(SavedSearch.id == search_id)
+        .filter(SavedSearch.tracker_id == tracker.id)
+        .filter(SavedSearch.user_id == current_user.id)).one_or_none()
+    if not saved:
+        abort(404)
+
+    db.session.delete(saved)
+    db.session.commit()
+    return redirect(url_for("html.index_GET"))
+
 @tracker.route("/<owner>/<name>", methods=["POST"])
 @loginrequired
 def tracker_submit_POST(owner, name):
-    tracker, access = get_tracker(owner, name, True)
+    tracker, access = get_tracker(owner, name)
     if not tracker:
         abort(404)
     if not TicketAccess.submit in access:
         abort(403)
 
-    db.session.commit() # Unlock tracker row
-
     valid = Validation(request)
     title = valid.require("title", friendly_name="Title")
     desc = valid.optional("description")
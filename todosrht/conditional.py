@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pkg_resources
+import sqlalchemy as sa
+from datetime import timedelta, timezone
+from flask import current_app, make_response, request
+from prometheus_client import Counter
+from srht.cache import get_cache, set_cache
+from srht.database import db
+from srht.flask import csrf_token
+from todosrht.types import Label
+
+metrics = type("metrics", tuple(), {
+    c.describe()[0].name: c
+    for c in [
+        Counter("todosrht_page_cache_access", "Number of page cache accesses"),
+        Counter("todosrht_page_cache_miss", "Number of page cache misses"),
+    ]
+})
+
+# Cached pages contain relative dates, so they are not kept for too long
+page_cache_ttl = timedelta(minutes=5)
+# Stands in for the viewer's CSRF token in cached pages
+csrf_placeholder = "\0csrf_token\0"
+
+def _template_version():
+    """
+    Hashes the package version and the templates, so that validators change
+    whenever a deployment changes how a page or API response is rendered.
+    """
+    try:
+        version = pkg_resources.get_distribution("todosrht").version
+    except:
+        version = "unknown"
+    digest = hashlib.sha256(version.encode())
+    templates = os.path.join(os.path.dirname(__file__), "templates")
+    for root, dirs, files in sorted(os.walk(templates)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+template_version = _template_version()
+
+def make_etag(*keys):
+    """Returns an ETag for a response which depends only on the given keys."""
+    digest = hashlib.sha256(template_version.encode())
+    for key in keys:
+        digest.update(b"\0" + repr(key).encode())
+    return digest.hexdigest()[:32]
+
+def tracker_state(tracker, tickets=True):
+    """
+    Returns a tuple which changes whenever the tracker, its labels or, unless
+    tickets is False, any of its tickets change, along with the time of the
+    most recent of those changes. Tickets are covered by the tracker's ticket
+    version, so they are not queried.
+    """
+    label_updated, label_count = (db.session
+        .query(sa.func.max(Label.updated), sa.func.count(Label.id))
+        .filter(Label.tracker_id == tracker.id)).one()
+    state = (tracker.id, tracker.updated, label_updated, label_count)
+    updated = [tracker.updated, label_updated]
+    if tickets:
+        state += (tracker.ticket_version,)
+        updated.append(tracker.ticket_updated)
+    return state, max(u for u in updated if u)
+
+def not_modified(etag, last_modified):
+    """
+    Returns a 304 response if the client's copy, identified by the request's
+    validators, is still current. Otherwise, returns None and the caller
+    should render the response and pass it to add_validators.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since:
+        since = request.if_modified_since
+        if since.tzinfo:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        fresh = last_modified.replace(microsecond=0) <= since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return add_validators(current_app.response_class(status=304),
+            etag, last_modified)
+
+def add_validators(response, etag, last_modified):
+    """
+    Sets the ETag and Last-Modified headers on a response. Responses depend
+    on the viewer, so they may only be cached privately, and must be
+    revalidated on each use.
+    """
+    response = make_response(response)
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_page(etag, render):
+    """
+    Returns the page identified by etag from the cache, or renders and caches
+    it with render(). The ETag must cover everything the page depends on, and
+    the page may not depend on the viewer, apart from the CSRF token, which
+    is substituted for each viewer. Since ETags include the updated timestamps
+    of what is shown, updates do not need to invalidate cached pages.
+    """
+    key = f"todo.sr.ht:page:{etag}"
+    token = str(csrf_token())
+    value = get_cache(key)
+    metrics.todosrht_page_cache_access.inc()
+    if value:
+        return value.decode().replace(csrf_placeholder, token)
+
+    metrics.todosrht_page_cache_miss.inc()
+    page = render()
+    set_cache(key, page_cache_ttl, page.replace(token, csrf_placeholder))
+    return page
@@ -41,6 +41,7 @@ class TodoApp(SrhtFlask):
         self.add_template_filter(urls.ticket_unassign_url)
         self.add_template_filter(urls.ticket_url)
         self.add_template_filter(urls.tracker_labels_url)
+        self.add_template_filter(urls.tracker_search_url)
         self.add_template_filter(urls.tracker_url)
         self.add_template_filter(urls.user_url)
 
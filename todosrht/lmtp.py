@@ -0,0 +1,486 @@
+"""
+Delivery of incoming mail to trackers and tickets, for todosrht-lmtp.
+"""
+from aiosmtpd.lmtp import LMTP
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesFeedParser, BytesParser
+from email.utils import parseaddr
+from prometheus_client import Counter, Gauge, Histogram
+from srht.config import cfg
+from srht.database import db
+from srht.graphql import exec_gql
+from srht.validation import Validation
+from todosrht.access import get_tracker, get_tracker_by_id, get_ticket
+from todosrht.types import TicketAccess, Tracker, Ticket
+from todosrht.types import Label, TicketSubscription, ParticipantType
+from todosrht.tickets import get_participant_for_email
+from werkzeug.exceptions import HTTPException
+import asyncio
+import email.message
+import email.policy
+import re
+import shlex
+import sqlalchemy as sa
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+# Deliveries block on the database and on the GraphQL API, so they are run on
+# a bounded pool of worker threads, each with its own database session.
+concurrency = int(cfg("todo.sr.ht::mail", "concurrency", default=4))
+executor = ThreadPoolExecutor(max_workers=concurrency,
+        thread_name_prefix="lmtp-delivery")
+
+# Messages larger than this are refused while they are being received, and
+# text/plain bodies larger than this are rejected once decoded
+max_message_size = int(cfg("todo.sr.ht::mail", "max-message-size",
+        default=33554432))
+max_body_size = int(cfg("todo.sr.ht::mail", "max-body-size", default=65536))
+parse_chunk_size = 65536
+header_end = re.compile(rb"\r?\n\r?\n")
+
+metrics = type("metrics", tuple(), {
+    c.describe()[0].name: c
+    for c in [
+        Gauge("todosrht_lmtp_queue_depth",
+            "Number of messages waiting for a delivery worker"),
+        Gauge("todosrht_lmtp_deliveries_active",
+            "Number of messages currently being delivered"),
+        Histogram("todosrht_lmtp_delivery_seconds",
+            "Time spent delivering a message"),
+        Counter("todosrht_lmtp_destination_cache_access",
+            "Number of destination cache accesses"),
+        Counter("todosrht_lmtp_destination_cache_miss",
+            "Number of destination cache misses"),
+    ]
+})
+
+# Address formats are:
+# Tracker (opening a new ticket):
+#   ~username/tracker@todo.sr.ht
+#     or (for shitty MTAs):
+#   u.username.tracker@todo.sr.ht
+# Ticket (participating in discussion):
+#   ~username/tracker/1234@todo.sr.ht
+#     or (for shitty MTAs):
+#   u.username.tracker.1234@todo.sr.ht
+# Tracker (un)subscribe:
+#   ~username/tracker/subscribe@todo.sr.ht
+#   ~username/tracker/unsubscribe@todo.sr.ht
+#     or (for shitty MTAs):
+#   u.username.tracker.subscribe@todo.sr.ht
+#   u.username.tracker.unsubscribe@todo.sr.ht
+# Ticket (un)subscribe:
+#   ~username/tracker/1234/subscribe@todo.sr.ht
+#   ~username/tracker/1234/unsubscribe@todo.sr.ht
+#     or (for shitty MTAs):
+#   u.username.tracker.1234.subscribe@todo.sr.ht
+#   u.username.tracker.1234.unsubscribe@todo.sr.ht
+sub_actions = {"subscribe": True, "unsubscribe": False}
+
+def parse_address(address):
+    """
+    Parses a recipient address into (owner, tracker name, ticket ID,
+    subscription action), or returns None if the address is invalid.
+    """
+    address = address[:address.rfind("@")]
+    if address.startswith("~"):
+        # TODO: user groups
+        owner, *parts = address.split("/")
+    else:
+        prefix, *parts = address.split(".")
+        if prefix != "u" or not parts:
+            # TODO: user groups
+            return None
+        owner = "~" + parts.pop(0)
+    if not 1 <= len(parts) <= 3:
+        return None
+
+    tracker_name, *parts = parts
+    ticket_id = None
+    sub_action = None
+    if parts:
+        try:
+            ticket_id = int(parts[0])
+            parts = parts[1:]
+        except ValueError:
+            if len(parts) != 1:
+                return None
+    if parts:
+        if parts[0] not in sub_actions:
+            return None
+        sub_action = sub_actions[parts[0]]
+    return owner, tracker_name, ticket_id, sub_action
+
+class DestinationCache:
+    """
+    A small LRU cache with a TTL, mapping (owner, tracker name) to a tracker
+    ID. Shared by all delivery workers.
+    """
+    def __init__(self, ttl=60, size=1024):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+destination_cache = DestinationCache()
+
+# Errors which may not happen again if the message is retried later
+transient_errors = (
+    sa.exc.OperationalError,
+    sa.exc.InterfaceError,
+    sa.exc.TimeoutError,
+    # Includes connection errors from the GraphQL API
+    OSError,
+)
+
+def error_status(ex):
+    """
+    Returns the status to reply with for a recipient whose delivery raised
+    an exception. Only transient errors ask the sender to retry.
+    """
+    if isinstance(ex, transient_errors):
+        return "451 Requested action aborted: error in processing"
+    if isinstance(ex, HTTPException):
+        if ex.code in [401, 403]:
+            return "550 You do not have permission to post on this tracker."
+        if ex.code == 404:
+            return "550 The tracker or ticket you requested does not exist."
+    return "554 Transaction failed: error in processing"
+
+class MailHandler:
+    def lookup_tracker(self, owner, tracker_name, sender):
+        """
+        Looks up a tracker by name, using the destination cache to skip the
+        owner and tracker name lookups. Access is always checked for the
+        sender.
+        """
+        key = (owner, tracker_name)
+        metrics.todosrht_lmtp_destination_cache_access.inc()
+        tracker_id = destination_cache.get(key)
+        if tracker_id is not None:
+            tracker = Tracker.query.get(tracker_id)
+            # The tracker may have been deleted or renamed since
+            if tracker and tracker.name == tracker_name:
+                # Access is checked against the already loaded tracker
+                return get_tracker_by_id(tracker.id, user=sender.user)
+            destination_cache.invalidate(key)
+
+        metrics.todosrht_lmtp_destination_cache_miss.inc()
+        tracker, access = get_tracker(owner, tracker_name, user=sender.user)
+        if tracker:
+            destination_cache.set(key, tracker.id)
+        return tracker, access
+
+    def lookup_destination(self, address, sender, trackers):
+        """
+        Resolves a recipient address to (destination, subscription action,
+        access). Trackers are looked up through the trackers dict, which is
+        shared between the recipients of a single message.
+        """
+        parsed = parse_address(address)
+        if not parsed:
+            return None, None, None
+        owner, tracker_name, ticket_id, sub_action = parsed
+        # TODO: ACLs for email participants
+        if (owner, tracker_name) not in trackers:
+            trackers[(owner, tracker_name)] = self.lookup_tracker(
+                    owner, tracker_name, sender)
+        tracker, access = trackers[(owner, tracker_name)]
+        if not tracker or not ticket_id:
+            return tracker, sub_action, access
+        ticket, access = get_ticket(tracker, ticket_id, user=sender.user)
+        return ticket, sub_action, access
+
+    async def handle_RCPT(self, server, session,
+            envelope, address, rcpt_options):
+        print("RCPT {}".format(address))
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    def handle_tracker_message(self, tracker, sender, access, mail, body):
+        if not TicketAccess.submit in access:
+            print("Rejected, insufficient permissions")
+            return "550 You do not have permission to post on this tracker."
+
+        valid = Validation({})
+
+        input = {
+            "subject": mail["Subject"],
+            "body": body,
+            "senderId": sender.id,
+            "messageId": mail["Message-ID"],
+        }
+
+        resp = exec_gql("todo.sr.ht", """
+            mutation SubmitTicketEmail($trackerId: Int!, $input: SubmitTicketEmailInput!) {
+                submitTicketEmail(trackerId: $trackerId, input: $input) {
+                    id
+                }
+            }
+        """, user=tracker.owner, valid=valid, trackerId=tracker.id, input=input)
+
+        if not valid.ok:
+            print("Rejecting email due to validation errors")
+            return "550 " + ", ".join([e.message for e in valid.errors])
+
+        ticket, _ = get_ticket(tracker, resp["submitTicketEmail"]["id"], user=sender.user)
+
+        print(f"Created ticket {ticket.ref()}")
+        return "250 Message accepted for delivery"
+
+    def handle_ticket_message(self, ticket, sender, access, mail, body):
+        required_access = TicketAccess.comment
+        last_line = body.splitlines()[-1]
+
+        valid = Validation({})
+
+        input = {
+            "text": body,
+            "senderId": sender.id,
+        }
+
+        cmds = ["!resolve", "!resolved", "!reopen"]
+        if sender.participant_type == ParticipantType.user:
+            # TODO: This should be possible via ACLs later
+            cmds += ["!assign", "!label", "!unlabel"]
+        if any(last_line.startswith(cmd) for cmd in cmds):
+            cmd = shlex.split(last_line)
+            input["text"] = body.rstrip()[:-len(last_line)-1].rstrip()
+            required_access = TicketAccess.triage
+            if cmd[0] in ["!resolve", "!resolved"] and len(cmd) == 2:
+                input["cmd"] = "RESOLVE"
+                input["resolution"] = cmd[1].upper()
+            elif cmd[0] == "!reopen":
+                input["cmd"] = "REOPEN"
+            elif cmd[0] == "!label" or cmd[0] == "!unlabel":
+                if cmd[0] == "!label":
+                    input["cmd"] = "LABEL"
+                else:
+                    input["cmd"] = "UNLABEL"
+                labels = Label.query.filter(
+                        Label.name.in_(cmd[1:]),
+                        Label.tracker_id == ticket.tracker_id).all()
+                if len(labels) != len(cmd) - 1:
+                    return ("550 The label you requested does not exist on " +
+                        "this tracker.")
+                if not TicketAccess.triage in access:
+                    print(f"Rejected, {sender.name} has insufficient " +
+                        f"permissions (have {access}, want triage)")
+                    return "550 You do not have permission to triage on this tracker."
+                input["labelIds"] = [label.id for label in labels]
+            # TODO: Remaining commands
+
+        if not required_access in access:
+            print(f"Rejected, {sender.name} has insufficient " +
+                f"permissions (have {access}, want {required_access})")
+            return "550 You do not have permission to post on this tracker."
+
+        if body and 3 > len(body) > 16384:
+            print("Rejected, invalid comment length")
+            return "550 Comment must be between 3 and 16384 characters."
+
+        resp = exec_gql("todo.sr.ht", """
+            mutation SubmitCommentEmail($trackerId: Int!, $ticketId: Int!, $input: SubmitCommentEmailInput!) {
+                submitCommentEmail(trackerId: $trackerId, ticketId: $ticketId, input: $input) {
+                    id
+                }
+            }
+        """, user=ticket.tracker.owner, valid=valid, trackerId=ticket.tracker_id, ticketId=ticket.scoped_id, input=input)
+
+        if not valid.ok:
+            print("Rejecting email due to validation errors")
+            return "550 " + ", ".join([e.message for e in valid.errors])
+
+        print(f"Added comment to {ticket.ref()}")
+        return "250 Message accepted for delivery"
+
+    async def handle_DATA(self, server, session, envelope):
+        metrics.todosrht_lmtp_queue_depth.inc()
+        lmtp = isinstance(server, LMTP)
+        return await asyncio.get_running_loop().run_in_executor(
+                executor, self.deliver, envelope, lmtp)
+
+    def deliver(self, envelope, lmtp):
+        """Runs on a worker thread. Delivers a message using a fresh session."""
+        metrics.todosrht_lmtp_queue_depth.dec()
+        metrics.todosrht_lmtp_deliveries_active.inc()
+        try:
+            with metrics.todosrht_lmtp_delivery_seconds.time():
+                statuses = self._handle_DATA(envelope)
+        finally:
+            db.session.remove()
+            metrics.todosrht_lmtp_deliveries_active.dec()
+
+        if lmtp:
+            # LMTP expects one reply per recipient, in RCPT TO order
+            return "\r\n".join(statuses)
+        # Plain SMTP gets a single reply, so report the first failure
+        return next((s for s in statuses if not s.startswith("2")),
+                statuses[0])
+
+    def get_body(self, content):
+        """
+        Returns the plaintext body of a message, or an error status. The
+        message is fed to the parser a chunk at a time, so a message with an
+        HTML part is rejected without parsing the remainder.
+        """
+        parts = list()
+        def factory(policy):
+            part = email.message.EmailMessage(policy=policy)
+            parts.append(part)
+            return part
+
+        parser = BytesFeedParser(_factory=factory, policy=email.policy.SMTP)
+        # The parser creates a message of its own when it is constructed,
+        # which is never used for the parsed message
+        parts.clear()
+        scanned = 0
+        for i in range(0, len(content), parse_chunk_size):
+            parser.feed(content[i:i+parse_chunk_size])
+            # The parser sets all of a part's headers at once, so any part
+            # with headers has a final content type
+            while scanned < len(parts) and len(parts[scanned]) > 0:
+                if parts[scanned].get_content_type() == "text/html":
+                    print("Rejected, HTML email")
+                    return None, "550 HTML emails are not permitted on SourceHut"
+                scanned += 1
+        mail = parser.close()
+
+        body = None
+        for part in mail.walk():
+            if part.is_multipart():
+                continue
+            content_type = part.get_content_type()
+            [charset] = part.get_charsets("utf-8")
+            if content_type == 'text/plain' and not body:
+                payload = part.get_payload(decode=True)
+                if len(payload) > max_body_size:
+                    print("Rejected, body too large")
+                    return None, ("552 The message body exceeds the " +
+                        f"maximum size of {max_body_size} bytes.")
+                body = payload.decode(charset)
+            if content_type == 'text/html':
+                print("Rejected, HTML email")
+                return None, "550 HTML emails are not permitted on SourceHut"
+        if not body:
+            print("Rejected, requires plaintext part")
+            return None, ("550 At least one text/plain part is required " +
+                "to use this service.")
+        return body, None
+
+    def _handle_DATA(self, envelope):
+        """
+        Delivers a message to each of its recipients. The message, its
+        sender, and any trackers it is addressed to are only resolved once.
+        Returns one status per recipient.
+        """
+        # Only the headers are needed to resolve the sender and recipients.
+        # The body is parsed later, and only if a recipient needs it.
+        end = header_end.search(envelope.content)
+        mail = BytesParser(policy=email.policy.SMTP).parsebytes(
+                envelope.content[:end.end()] if end else envelope.content,
+                headersonly=True)
+        name, sender_addr = parseaddr(mail["From"])
+        sender = get_participant_for_email(sender_addr, name)
+        # A new participant is committed before any recipient is handled, so
+        # that rolling back a failed recipient does not discard it
+        db.session.commit()
+
+        trackers = dict()
+        body = error = None
+        statuses = list()
+        for address in envelope.rcpt_tos:
+            try:
+                dest, sub_action, access = self.lookup_destination(
+                        address, sender, trackers)
+                if dest is None:
+                    print(f"Rejected {address}, destination not found")
+                    statuses.append("550 The tracker or ticket you " +
+                        "requested does not exist.")
+                    continue
+
+                if sub_action is not None:
+                    statuses.append(self.handle_un_subscription(
+                        dest, sender, sub_action))
+                    continue
+
+                if body is None and error is None:
+                    body, error = self.get_body(envelope.content)
+                if error:
+                    statuses.append(error)
+                elif isinstance(dest, Tracker):
+                    statuses.append(self.handle_tracker_message(
+                        dest, sender, access, mail, body))
+                elif isinstance(dest, Ticket):
+                    statuses.append(self.handle_ticket_message(
+                        dest, sender, access, mail, body))
+                else:
+                    assert False
+            except Exception as ex:
+                db.session.rollback()
+                print(f"Error delivering to {address}")
+                traceback.print_exc()
+                statuses.append(error_status(ex))
+        return statuses
+
+    def handle_un_subscription(self, dest, participant, do_subscribe):
+        if isinstance(dest, Tracker):
+            tracker_id = dest.id
+            ticket_id = None
+        elif isinstance(dest, Ticket):
+            tracker_id = None
+            ticket_id = dest.id
+        else:
+            assert False
+
+        sub = (TicketSubscription.query
+            .filter(TicketSubscription.tracker_id == tracker_id)
+            .filter(TicketSubscription.ticket_id == ticket_id)
+            .filter(TicketSubscription.participant_id == participant.id)
+        ).one_or_none()
+
+        if sub:
+            if do_subscribe:
+                return "250 Already subscribed"
+            db.session.delete(sub)
+        else:
+            if not do_subscribe:
+                return "250 Not subscribed"
+            sub = TicketSubscription()
+            sub.tracker_id = tracker_id
+            sub.ticket_id = ticket_id
+            sub.participant_id = participant.id
+            db.session.add(sub)
+
+        db.session.commit()
+        if do_subscribe:
+            print(f"Subscribed to {dest.ref()}")
+            return "250 Subscribed"
+        else:
+            print(f"Unsubscribed from {dest.ref()}")
+            return "250 Unsubscribed"
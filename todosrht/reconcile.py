@@ -0,0 +1,81 @@
+"""
+Repairs of denormalized counters, for todosrht-reconcile.
+
+Each function fixes the rows of one counter with start <= id < end in its own
+transaction, and returns the IDs of the rows which had drifted.
+"""
+import sqlalchemy as sa
+from srht.database import db
+
+def _fix(statement, start, end, dry_run):
+    result = db.session.execute(sa.text(statement),
+            {"start": start, "end": end})
+    fixed = [row[0] for row in result]
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return fixed
+
+def reconcile_comment_counts(start, end, dry_run):
+    """Fixes ticket.comment_count for tickets with start <= id < end."""
+    return _fix("""
+        UPDATE ticket AS t
+        SET comment_count = c.n
+        FROM (
+            SELECT t.id AS ticket_id, count(tc.id) AS n
+            FROM ticket t
+            LEFT JOIN ticket_comment tc
+                ON tc.ticket_id = t.id AND tc.superceeded_by_id IS NULL
+            WHERE t.id >= :start AND t.id < :end
+            GROUP BY t.id
+        ) c
+        WHERE t.id = c.ticket_id AND t.comment_count != c.n
+        RETURNING id
+    """, start, end, dry_run)
+
+def reconcile_tracker_counts(start, end, dry_run):
+    """
+    Fixes tracker_ticket_stats.open_ticket_count and closed_ticket_count for
+    trackers with start <= id < end.
+    """
+    return _fix("""
+        UPDATE tracker_ticket_stats AS s
+        SET open_ticket_count = c.open_count,
+            closed_ticket_count = c.closed_count
+        FROM (
+            SELECT tr.id,
+                count(t.id) FILTER (WHERE t.status != 8) AS open_count,
+                count(t.id) FILTER (WHERE t.status = 8) AS closed_count
+            FROM tracker tr
+            LEFT JOIN ticket t ON t.tracker_id = tr.id
+            WHERE tr.id >= :start AND tr.id < :end
+            GROUP BY tr.id
+        ) c
+        WHERE s.tracker_id = c.id AND (s.open_ticket_count != c.open_count
+            OR s.closed_ticket_count != c.closed_count)
+        RETURNING tracker_id
+    """, start, end, dry_run)
+
+def reconcile_label_counts(start, end, dry_run):
+    """Fixes label.ticket_count for labels with start <= id < end."""
+    return _fix("""
+        UPDATE label AS l
+        SET ticket_count = c.n
+        FROM (
+            SELECT l.id AS label_id, count(tl.ticket_id) AS n
+            FROM label l
+            LEFT JOIN ticket_label tl ON tl.label_id = l.id
+            WHERE l.id >= :start AND l.id < :end
+            GROUP BY l.id
+        ) c
+        WHERE l.id = c.label_id AND l.ticket_count != c.n
+        RETURNING id
+    """, start, end, dry_run)
+
+# Maps each counter to the table it is stored in and its reconcile function
+counters = {
+    "comment-counts": ("ticket", reconcile_comment_counts),
+    "tracker-counts": ("tracker", reconcile_tracker_counts),
+    "label-counts": ("label", reconcile_label_counts),
+}
@@ -0,0 +1,160 @@
+import sqlalchemy as sa
+from srht.database import db
+from todosrht.access import get_trackers_access
+from todosrht.search import apply_search
+from todosrht.types import SavedSearch, SavedSearchTicket, Ticket, Tracker
+from todosrht.types import TicketAccess, TrackerTicketStats
+
+def _needs_rebuild(saved):
+    """
+    Returns True if the stored results of a saved search cannot be brought
+    up to date from the tickets written since, either because they were never
+    computed, or because a ticket was since deleted from the tracker or moved
+    to another one.
+    """
+    return (saved.tracker_version is None
+        or saved.tracker.removed_version > saved.tracker_version)
+
+def _changed_tickets(saved):
+    """Returns a query of the tickets whose results need searching again."""
+    tickets = Ticket.query.filter(Ticket.tracker_id == saved.tracker_id)
+    if _needs_rebuild(saved):
+        return tickets
+    return tickets.filter(Ticket.tracker_version > saved.tracker_version)
+
+def _matching_ids(changed, saved):
+    return (apply_search(changed, saved.search, saved.user)
+        .with_entities(Ticket.id)
+        .order_by(None)
+        .distinct()).subquery()
+
+def refresh_saved_search(saved):
+    """
+    Brings the stored results of a saved search up to date with its tracker.
+    Only the tickets written since the results were last brought up to date
+    are searched again, unless they need rebuilding. Raises ValueError if the
+    search is no longer valid.
+    """
+    version = saved.tracker.ticket_version
+    if saved.tracker_version == version:
+        return
+
+    # Keeps concurrent refreshes from adding the same tickets twice
+    saved = (SavedSearch.query
+        .filter(SavedSearch.id == saved.id)
+        .populate_existing()
+        .with_for_update()).one()
+    if saved.tracker_version == version:
+        return
+
+    rebuild = _needs_rebuild(saved)
+    changed = _changed_tickets(saved)
+    matching_ids = _matching_ids(changed, saved)
+    results = SavedSearchTicket.__table__
+
+    if rebuild:
+        db.session.execute(results.delete()
+            .where(results.c.saved_search_id == saved.id))
+    else:
+        # Changed tickets which no longer match are dropped, and those which
+        # now match are added. Other tickets keep their previous result.
+        changed_ids = changed.with_entities(Ticket.id).subquery()
+        db.session.execute(results.delete()
+            .where(results.c.saved_search_id == saved.id)
+            .where(results.c.ticket_id.in_(sa.select([changed_ids.c.id])))
+            .where(~results.c.ticket_id.in_(sa.select([matching_ids.c.id]))))
+    existing = (sa.select([results.c.ticket_id])
+        .where(results.c.saved_search_id == saved.id))
+    db.session.execute(results.insert().from_select(
+        ["saved_search_id", "ticket_id"],
+        sa.select([sa.literal(saved.id, sa.Integer), matching_ids.c.id])
+            .where(~matching_ids.c.id.in_(existing))))
+
+    saved.tracker_version = version
+
+def _count_results(saved):
+    """
+    Counts the results of a saved search whose stored results are out of
+    date, without writing them. Stored results are counted as they are for
+    tickets which were not written since, and the others are searched again.
+    """
+    changed = _changed_tickets(saved)
+    matching = (db.session
+        .query(sa.func.count())
+        .select_from(_matching_ids(changed, saved))).scalar()
+    if _needs_rebuild(saved):
+        return matching
+    changed_ids = changed.with_entities(Ticket.id).subquery()
+    kept = (SavedSearchTicket.query
+        .filter(SavedSearchTicket.saved_search_id == saved.id)
+        .filter(~SavedSearchTicket.ticket_id.in_(
+            sa.select([changed_ids.c.id])))).count()
+    return kept + matching
+
+def get_saved_searches(user):
+    """
+    Returns (saved search, result count) for each saved search of a user on
+    trackers they can still browse. The count is None for searches which are
+    no longer valid.
+
+    Nothing is written: stored results which are out of date are counted with
+    the tickets written since, and brought up to date by todosrht-periodic.
+    """
+    searches = (SavedSearch.query
+        .filter(SavedSearch.user_id == user.id)
+        .options(sa.orm.joinedload(SavedSearch.tracker)
+            .joinedload(Tracker.stats))
+        .order_by(SavedSearch.name)).all()
+    access = get_trackers_access({saved.tracker for saved in searches}, user)
+    searches = [saved for saved in searches
+        if TicketAccess.browse in access[saved.tracker_id]]
+
+    current = [saved.id for saved in searches
+        if saved.tracker_version == saved.tracker.ticket_version]
+    counts = dict()
+    if current:
+        counts = dict(db.session
+            .query(SavedSearchTicket.saved_search_id, sa.func.count())
+            .filter(SavedSearchTicket.saved_search_id.in_(current))
+            .group_by(SavedSearchTicket.saved_search_id))
+
+    results = list()
+    for saved in searches:
+        if saved.id in current:
+            count = counts.get(saved.id, 0)
+        else:
+            try:
+                count = _count_results(saved)
+            except ValueError:
+                count = None
+        results.append((saved, count))
+    return results
+
+def refresh_saved_searches():
+    """
+    Brings the stored results of every out of date saved search up to date,
+    each in its own transaction. Returns the number of searches refreshed.
+    """
+    stale = (db.session
+        .query(SavedSearch.id)
+        .join(TrackerTicketStats,
+            TrackerTicketStats.tracker_id == SavedSearch.tracker_id)
+        .filter(sa.or_(SavedSearch.tracker_version == None,
+            SavedSearch.tracker_version !=
+                TrackerTicketStats.ticket_version))).all()
+    db.session.commit()
+
+    refreshed = 0
+    for saved_id, in stale:
+        saved = SavedSearch.query.get(saved_id)
+        if not saved:
+            continue
+        try:
+            refresh_saved_search(saved)
+        except ValueError:
+            # Shown as no longer valid on the dashboard
+            db.session.rollback()
+            continue
+        db.session.commit()
+        refreshed += 1
+    return refreshed
@@ -1,7 +1,10 @@
+import sqlalchemy as sa
+from flask import request
 from sqlalchemy import or_
 from srht import search
+from srht.database import db
 from todosrht.types import Label, Ticket, TicketStatus, TicketComment
-from todosrht.types import Participant, User
+from todosrht.types import Participant, TicketAssignee, TicketLabel, User
 
 
 STATUS_ALIASES = {
@@ -14,12 +17,24 @@ STATUS_ALIASES = {
     "closed": [TicketStatus.resolved]
 }
 
+def _alias_filter(statuses):
+    # Written as an inequality where possible, to match the partial indexes
+    # on open tickets
+    others = [s for s in TicketStatus.__members__.values()
+            if s not in statuses]
+    if len(others) == 1:
+        return Ticket.status != others[0]
+    return Ticket.status.in_(statuses)
+
+_alias_filters = {alias: _alias_filter(statuses)
+        for alias, statuses in STATUS_ALIASES.items()}
+
 def status_filter(value):
     if value == "any":
         return True
 
     if value in STATUS_ALIASES:
-        return Ticket.status.in_(STATUS_ALIASES[value])
+        return _alias_filters[value]
 
     status = getattr(TicketStatus, value, None)
     if status is None:
@@ -27,21 +42,61 @@ def status_filter(value):
 
     return Ticket.status == status
 
-def submitter_filter(value, current_user):
-    if value == "me" and current_user:
-        return Ticket.submitter == current_user
-    else:
-        return Ticket.submitter.has(
-            Participant.user.has(User.username.ilike(value.lstrip("~")))
-        )
+def resolve_users(terms, current_user):
+    """
+    Looks up all users named in submitter: and assigned: terms in a single
+    query. Returns a dict mapping each username to a (user ID, participant
+    ID) tuple, where the participant ID is None for users who never
+    participated in a tracker.
+    """
+    names = set()
+    for term in terms:
+        if term.key not in ["submitter", "assigned"]:
+            continue
+        if term.value == "me":
+            if current_user:
+                names.add(current_user.username)
+        else:
+            # Usernames are always lowercase
+            names.add(term.value.lstrip("~").lower())
+    if not names:
+        return {}
 
-def assignee_filter(value, current_user):
-    if value == "me" and current_user:
-        return Ticket.assigned_users.contains(current_user)
+    rows = (db.session
+        .query(User.username, User.id, Participant.id)
+        .outerjoin(Participant, Participant.user_id == User.id)
+        .filter(User.username.in_(names)))
+    return {username: (user_id, participant_id)
+            for username, user_id, participant_id in rows}
+
+def lookup_user(value, users, current_user):
+    """
+    Returns the (user ID, participant ID) of a user named in a search term,
+    from the result of resolve_users. "me" matches nobody for anonymous
+    users, so both IDs are None.
+    """
+    if value == "me":
+        if not current_user:
+            return None, None
+        username = current_user.username
     else:
-        return Ticket.assigned_users.any(
-            User.username.ilike(value.lstrip("~"))
-        )
+        username = value.lstrip("~").lower()
+    if username not in users:
+        raise ValueError(f"Unknown user: '{value}'")
+    return users[username]
+
+def submitter_filter(value, users, current_user):
+    _, participant_id = lookup_user(value, users, current_user)
+    if participant_id is None:
+        return sa.false()
+    return Ticket.submitter_id == participant_id
+
+def assignee_filter(value, users, current_user):
+    user_id, _ = lookup_user(value, users, current_user)
+    if user_id is None:
+        return sa.false()
+    return Ticket.id.in_(sa.select([TicketAssignee.ticket_id])
+            .where(TicketAssignee.assignee_id == user_id))
 
 def label_filter(value):
     return Ticket.labels.any(Label.name == value)
@@ -83,7 +138,17 @@ def apply_sort(query, terms, column_map):
 
     return query
 
-def apply_search(query, search_string, current_user):
+SORT_COLUMNS = {
+    "created": Ticket.created,
+    "updated": Ticket.updated,
+    "comments": Ticket.comment_count,
+}
+
+def parse_search(search_string):
+    """
+    Splits a search string into its search terms and its sort terms, adding
+    the default status filter and sort order if not given.
+    """
     terms = list(search.parse_terms(search_string))
     sort_terms = [t for t in terms if t.key in ["sort", "rsort"]]
     search_terms = [t for t in terms if t.key not in ["sort", "rsort"]]
@@ -96,19 +161,156 @@ def apply_search(query, search_string, current_user):
     if not sort_terms:
         sort_terms = [search.Term("sort", "updated", True)]
 
+    return search_terms, sort_terms
+
+def apply_search(query, search_string, current_user):
+    search_terms, sort_terms = parse_search(search_string)
+
+    # Users are resolved upfront, so that their filters compare IDs
+    users = resolve_users(search_terms, current_user)
+
     query = search.apply_terms(query, search_terms, default_filter, key_fns={
         "status": status_filter,
-        "submitter": lambda v: submitter_filter(v, current_user),
-        "assigned": lambda v: assignee_filter(v, current_user),
+        "submitter": lambda v: submitter_filter(v, users, current_user),
+        "assigned": lambda v: assignee_filter(v, users, current_user),
         "label": label_filter,
         "no": no_filter,
     })
 
-    return apply_sort(query, sort_terms, {
-        "created": Ticket.created,
-        "updated": Ticket.updated,
-        "comments": Ticket.comment_count,
-    })
+    return apply_sort(query, sort_terms, SORT_COLUMNS)
+
+def resolve_facets(counts):
+    """
+    Turns the facet counts of a search, given as a dict of facet names to
+    dicts of IDs to counts, into lists of (object, count) tuples.
+    """
+    labels = {}
+    if counts["label"]:
+        labels = {l.id: l for l in
+            Label.query.filter(Label.id.in_(counts["label"].keys()))}
+    users = {}
+    if counts["assignee"]:
+        users = {u.id: u for u in
+            User.query.filter(User.id.in_(counts["assignee"].keys()))}
+
+    return {
+        "status": [(TicketStatus(value), count)
+            for value, count in sorted(counts["status"].items())],
+        "labels": sorted(((labels[id], count)
+            for id, count in counts["label"].items() if id in labels),
+            key=lambda f: (-f[1], f[0].name)),
+        "assignees": sorted(((users[id], count)
+            for id, count in counts["assignee"].items() if id in users),
+            key=lambda f: (-f[1], f[0].username)),
+    }
+
+def count_facets(query):
+    """
+    Counts the tickets matched by a search query by status, label and
+    assignee, with a single grouped query. Returns a dict of facet names to
+    dicts of IDs to counts, which resolve_facets turns into objects.
+    """
+    results = query.with_entities(Ticket.id).order_by(None).cte("results")
+    ticket_ids = sa.select([results.c.id])
+    facets = sa.union_all(
+        sa.select([
+            sa.literal("status").label("facet"),
+            sa.type_coerce(Ticket.status, sa.Integer).label("value"),
+            sa.func.count().label("count"),
+        ]).where(Ticket.id.in_(ticket_ids)).group_by(Ticket.status),
+        sa.select([
+            sa.literal("label"),
+            TicketLabel.label_id,
+            sa.func.count(),
+        ]).where(TicketLabel.ticket_id.in_(ticket_ids))
+        .group_by(TicketLabel.label_id),
+        sa.select([
+            sa.literal("assignee"),
+            TicketAssignee.assignee_id,
+            sa.func.count(),
+        ]).where(TicketAssignee.ticket_id.in_(ticket_ids))
+        .group_by(TicketAssignee.assignee_id),
+    )
+
+    counts = {"status": {}, "label": {}, "assignee": {}}
+    for facet, value, count in db.session.execute(facets):
+        counts[facet][value] = count
+    return counts
+
+def search_facets(query):
+    """
+    Returns the facets of a search query as a dict of lists of (value, count)
+    tuples, where values are TicketStatuses, Labels and Users.
+    """
+    return resolve_facets(count_facets(query))
+
+def load_tickets(query, ids):
+    """Loads the tickets with the given IDs from a query, in that order."""
+    if not ids:
+        return []
+    tickets = {t.id: t for t in query.filter(Ticket.id.in_(ids))}
+    return [tickets[i] for i in ids if i in tickets]
+
+def requested_page():
+    """
+    Returns the page number requested in the query string. Missing, invalid
+    and out of range values are page 1.
+    """
+    try:
+        return max(int(request.args.get("page", 1)), 1)
+    except ValueError:
+        return 1
+
+def paginate_ids(query, ids, results_per_page=15):
+    """
+    Like paginate_query, for searches whose results are already known as an
+    ordered list of ticket IDs. Only the tickets of the requested page are
+    loaded from the query.
+    """
+    total_results = len(ids)
+    total_pages = total_results // results_per_page + 1
+    if total_results % results_per_page == 0:
+        total_pages -= 1
+    page = requested_page() - 1
+
+    start = page * results_per_page
+    tickets = load_tickets(query, ids[start:start + results_per_page])
+    return tickets, {
+        "total_pages": total_pages,
+        "page": page + 1,
+        "total_results": total_results,
+    }
+
+def paginate_capped(query, results_per_page=15, max_results=1000):
+    """
+    Like paginate_query, but counts at most max_results results, so that
+    searches matching a very large number of tickets are not counted in full.
+    Past that, total_results is max_results and more_results is True, and
+    only the pages of the first max_results results are listed.
+    """
+    counted = (query
+        .with_entities(Ticket.id)
+        .order_by(None)
+        .limit(max_results + 1)).subquery()
+    total_results = (db.session
+        .query(sa.func.count())
+        .select_from(counted)).scalar()
+    more_results = total_results > max_results
+    total_results = min(total_results, max_results)
+    total_pages = total_results // results_per_page + 1
+    if total_results % results_per_page == 0:
+        total_pages -= 1
+
+    page = requested_page() - 1
+    tickets = (query
+        .offset(page * results_per_page)
+        .limit(results_per_page)).all()
+    return tickets, {
+        "total_pages": total_pages,
+        "page": page + 1,
+        "total_results": total_results,
+        "more_results": more_results,
+    }
 
 def find_usernames(query, limit=20):
     """Given a partial username string, returns matching usernames."""
@@ -120,7 +322,6 @@ def find_usernames(query, limit=20):
     else:
         where = User.username.contains(query, autoescape=True)
 
-    from todosrht.app import db
     rows = (db.session
         .query(User.username)
         .filter(where)
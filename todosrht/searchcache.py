@@ -0,0 +1,76 @@
+import hashlib
+import json
+from datetime import timedelta
+from prometheus_client import Counter
+from srht.cache import get_cache, set_cache
+from todosrht.search import parse_search
+from todosrht.types import TicketAccess
+
+metrics = type("metrics", tuple(), {
+    c.describe()[0].name: c
+    for c in [
+        Counter("todosrht_search_cache_access",
+            "Number of search result cache accesses"),
+        Counter("todosrht_search_cache_miss",
+            "Number of search result cache misses"),
+    ]
+})
+
+# Keys include the tracker's ticket version, so entries never need to be
+# invalidated. This only limits how long outdated entries take up space.
+search_cache_ttl = timedelta(minutes=30)
+
+def search_key(tracker, search_string, access, user, page, results_per_page):
+    """
+    Returns the cache key of a page of search results on a tracker, or None
+    if they should not be cached. Equivalent search strings share a key. page
+    is the page number as an int, as returned by requested_page().
+    """
+    if TicketAccess.browse in access:
+        viewer = "browse"
+    elif user:
+        # Only the user's own tickets are listed
+        viewer = f"submitter:{user.id}"
+    else:
+        return None
+
+    try:
+        search_terms, sort_terms = parse_search(search_string)
+    except ValueError:
+        return None
+    if user and any(term.value == "me" for term in search_terms):
+        viewer += f":{user.id}"
+
+    terms = sorted({(t.key or "", t.value, t.inverse) for t in search_terms})
+    sort = [(t.key, t.value) for t in sort_terms]
+    digest = hashlib.sha256(repr(
+        (terms, sort, viewer, page, results_per_page)).encode()).hexdigest()
+    return f"todo.sr.ht:search:{tracker.id}:{tracker.ticket_version}:{digest}"
+
+def get_results(key):
+    """
+    Returns the cached (ticket IDs, pagination, facet counts) of a page of
+    search results, or None.
+    """
+    metrics.todosrht_search_cache_access.inc()
+    value = get_cache(key)
+    if not value:
+        metrics.todosrht_search_cache_miss.inc()
+        return None
+    value = json.loads(value)
+    facets = value["facets"]
+    if facets is not None:
+        facets = {name: dict(counts) for name, counts in facets.items()}
+    return value["ids"], value["pagination"], facets
+
+def set_results(key, ids, pagination, facets):
+    """Caches a page of search results, as returned by get_results."""
+    if facets is not None:
+        # JSON objects only have string keys
+        facets = {name: list(counts.items())
+            for name, counts in facets.items()}
+    set_cache(key, search_cache_ttl, json.dumps({
+        "ids": ids,
+        "pagination": pagination,
+        "facets": facets,
+    }))
@@ -0,0 +1,110 @@
+import json
+import sqlalchemy as sa
+import zlib
+from flask import current_app, g, has_request_context, request
+from flask import stream_with_context
+from srht.flask import date_handler
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(value):
+    """Serializes a value to JSON bytes, using orjson if it is available."""
+    if orjson:
+        return orjson.dumps(value, default=date_handler,
+                option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(value, default=date_handler).encode()
+
+def serialize(obj, memo=True):
+    """
+    Returns obj.to_dict() as JSON bytes. The result is memoized for the rest
+    of the request, so that an event delivered to several webhooks and
+    included in the response is only serialized once. Only serialize an
+    object once it will no longer change during the request. Pass
+    memo=False for objects which are not serialized again, such as those of
+    a bulk operation, so that they are not kept until the request ends.
+    """
+    if not memo or not has_request_context():
+        return dumps(obj.to_dict())
+    cache = g.setdefault("serialized", dict())
+    key = (type(obj), obj.id)
+    if key not in cache:
+        cache[key] = dumps(obj.to_dict())
+    return cache[key]
+
+def json_response(body, status=200):
+    """Returns a response for JSON bytes built from serialize()."""
+    return current_app.response_class(body,
+            status=status, mimetype="application/json")
+
+def requested_fields(valid, cls):
+    """
+    Returns the fields listed in the ?fields= query parameter as a set, or
+    None if it was not given. Unknown fields are reported through valid.
+    """
+    fields = request.args.get("fields")
+    if fields is None:
+        return None
+    fields = {f.strip() for f in fields.split(",") if f.strip()}
+    for field in sorted(fields - cls.dict_fields.keys()):
+        valid.error(f"Unknown field {field}", field="fields")
+    return fields
+
+def field_options(cls, fields=None):
+    """
+    Returns query options that eagerly load the relationships used to
+    serialize the given fields of cls, or all of its fields if None.
+    """
+    paths = set()
+    for field in (cls.dict_fields.keys() if fields is None else fields):
+        paths.update(cls.dict_fields[field])
+    options = list()
+    for path in sorted(paths):
+        option = None
+        entity = cls
+        for name in path.split("."):
+            attr = getattr(entity, name)
+            # Collections are loaded separately, so that the main query
+            # stays one row per object and can be paginated.
+            loader = "selectinload" if attr.property.uselist else "joinedload"
+            if option is None:
+                option = getattr(sa.orm, loader)(attr)
+            else:
+                option = getattr(option, loader)(attr)
+            entity = attr.property.mapper.class_
+        options.append(option)
+    return options
+
+# Lines are buffered into chunks of about this size before they are written
+stream_chunk_size = 65536
+
+def ndjson_response(objects):
+    """
+    Streams obj.to_dict() for each object as newline-delimited JSON, gzipped
+    if the client accepts it. Objects are serialized as they are produced, so
+    pass a query using yield_per, or a generator loading them in batches, to
+    keep memory use flat.
+    """
+    compress = bool(request.accept_encodings["gzip"])
+
+    def generate():
+        gzip = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+        chunk = bytearray()
+        for obj in objects:
+            chunk += dumps(obj.to_dict()) + b"\n"
+            if len(chunk) >= stream_chunk_size:
+                yield gzip.compress(bytes(chunk)) if gzip else bytes(chunk)
+                chunk.clear()
+        if gzip:
+            yield gzip.compress(bytes(chunk)) + gzip.flush()
+        elif chunk:
+            yield bytes(chunk)
+
+    response = current_app.response_class(stream_with_context(generate()),
+            mimetype="application/x-ndjson")
+    response.vary.add("Accept-Encoding")
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
@@ -8,9 +8,11 @@ from todosrht.email import notify, format_lines
 from todosrht.types import Event, EventType, EventNotification
 from todosrht.types import TicketComment, TicketStatus, TicketSubscription
 from todosrht.types import TicketAssignee, User, Ticket, Tracker
+from todosrht.types import TicketLabel
 from todosrht.types import Participant, ParticipantType
 from todosrht.urls import ticket_url
 from sqlalchemy import func, or_, and_
+import sqlalchemy as sa
 
 smtp_user = cfg("mail", "smtp-user", default=None)
 smtp_from = cfg("mail", "smtp-from", default=None)
@@ -301,9 +303,10 @@ def _handle_mentions(ticket, submitter, text, notified_users, comment=None):
 
 def add_comment(submitter, ticket,
         text=None, resolve=False, resolution=None, reopen=False,
-        from_email=False):
+        from_email=False, commit=True):
     """
-    Comment on a ticket, optionally resolve or reopen the ticket.
+    Comment on a ticket, optionally resolve or reopen the ticket. Pass
+    commit=False to leave committing the transaction to the caller.
     """
     # TODO better error handling
     assert text or resolve or reopen
@@ -328,10 +331,13 @@ def add_comment(submitter, ticket,
             comment,
         )
 
-    ticket.comment_count = get_comment_count(ticket.id)
+    if comment:
+        # Incremented in SQL, so concurrent comments are all counted
+        ticket.comment_count = Ticket.comment_count + 1
     ticket.updated = datetime.utcnow()
     ticket.tracker.updated = datetime.utcnow()
-    db.session.commit()
+    if commit:
+        db.session.commit()
 
     return event
 
@@ -386,7 +392,7 @@ def assign(ticket, assignee, assigner):
 
     # If already assigned, do nothing
     if ticket_assignee:
-        return ticket_assignee
+        return None
 
     ticket_assignee = TicketAssignee(
         ticket=ticket,
@@ -408,8 +414,9 @@ def assign(ticket, assignee, assigner):
     event.ticket_id = ticket.id
     event.by_participant_id = assigner_participant.id
     db.session.add(event)
+    ticket.updated = datetime.utcnow()
 
-    return ticket_assignee
+    return event
 
 def unassign(ticket, assignee, assigner):
     ticket_assignee = TicketAssignee.query.filter_by(
@@ -430,14 +437,48 @@ def unassign(ticket, assignee, assigner):
     event.ticket_id = ticket.id
     event.by_participant_id = assigner_participant.id
     db.session.add(event)
+    ticket.updated = datetime.utcnow()
 
-def get_comment_count(ticket_id):
-    """Returns the number of comments on a given ticket."""
-    return (
-        TicketComment.query
-        .filter_by(ticket_id=ticket_id, superceeded_by_id=None)
-        .count()
-    )
+def change_labels(ticket, participant, user, add=[], remove=[]):
+    """
+    Adds and removes the given labels on a ticket and returns the resulting
+    label events, removals first. The ticket labels are written with one
+    statement each way, and the events with a single flush.
+    """
+    if not add and not remove:
+        return []
+    now = datetime.utcnow()
+    if remove:
+        (TicketLabel.query
+            .filter(TicketLabel.ticket_id == ticket.id)
+            .filter(TicketLabel.label_id.in_([l.id for l in remove]))
+        ).delete(synchronize_session=False)
+    if add:
+        db.session.execute(TicketLabel.__table__.insert().values([{
+            "ticket_id": ticket.id,
+            "label_id": label.id,
+            "user_id": user.id,
+            "created": now,
+        } for label in add]))
+    # Ticket.labels is view-only, so it does not see the rows written above
+    db.session.expire(ticket, ["labels"])
+
+    ticket.updated = now
+
+    changes = ([(EventType.label_removed, l) for l in remove] +
+            [(EventType.label_added, l) for l in add])
+    events = list()
+    for event_type, label in changes:
+        event = Event()
+        event.created = now
+        event.event_type = event_type
+        event.participant = participant
+        event.ticket = ticket
+        event.label = label
+        db.session.add(event)
+        events.append(event)
+    db.session.flush()
+    return events
 
 def _send_new_ticket_notification(subscription, ticket, email_trigger_id):
     subject = f"{ticket.ref()}: {ticket.title}"
@@ -458,21 +499,41 @@ def _send_new_ticket_notification(subscription, ticket, email_trigger_id):
         headers=headers, description=ticket.description,
         ticket_url=ticket_url(ticket))
 
+def allocate_ticket_ids(tracker, count=1):
+    """
+    Reserves count consecutive scoped ticket IDs on a tracker and returns the
+    first of them. The counter is incremented with a single UPDATE ...
+    RETURNING, in a transaction of its own which is committed right away, so
+    concurrent submissions only wait on each other for that statement rather
+    than until the caller commits. IDs reserved by a submission which is then
+    rolled back are skipped.
+    """
+    with db.session.get_bind().begin() as conn:
+        next_id = conn.execute(sa.text("""
+            UPDATE tracker
+            SET next_ticket_id = next_ticket_id + :count, updated = :updated
+            WHERE id = :tracker_id
+            RETURNING next_ticket_id
+        """), {
+            "count": count,
+            "updated": datetime.utcnow(),
+            "tracker_id": tracker.id,
+        }).scalar()
+    db.session.expire(tracker, ["next_ticket_id", "updated"])
+    return next_id - count
+
 def submit_ticket(tracker, submitter, title, description,
         importing=False, from_email=False, from_email_id=None):
     ticket = Ticket(
         submitter=submitter,
         tracker=tracker,
-        scoped_id=tracker.next_ticket_id,
+        scoped_id=allocate_ticket_ids(tracker),
         title=title,
         description=description,
     )
     db.session.add(ticket)
     db.session.flush()
 
-    tracker.next_ticket_id += 1
-    tracker.updated = datetime.utcnow()
-
     event = Event(event_type=EventType.created,
             participant=submitter, ticket=ticket)
     db.session.add(event)
@@ -16,9 +16,10 @@ from todosrht.types.ticketstatus import TicketAuthenticity
 from todosrht.types.event import Event, EventType, EventNotification
 from todosrht.types.label import Label, TicketLabel
 from todosrht.types.participant import Participant, ParticipantType
+from todosrht.types.savedsearch import SavedSearch, SavedSearchTicket
 from todosrht.types.ticket import Ticket
 from todosrht.types.ticketassignee import TicketAssignee
 from todosrht.types.ticketcomment import TicketComment
 from todosrht.types.ticketsubscription import TicketSubscription
-from todosrht.types.tracker import Tracker, Visibility
+from todosrht.types.tracker import Tracker, TrackerTicketStats, Visibility
 from todosrht.types.useraccess import UserAccess
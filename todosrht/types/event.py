@@ -87,6 +87,10 @@ class Event(Base):
 
 class EventNotification(Base):
     __tablename__ = 'event_notification'
+    __table_args__ = (
+        # todosrht-periodic prunes notifications by age
+        sa.Index("event_notification_created", "created"),
+    )
     id = sa.Column(sa.Integer, primary_key=True)
     created = sa.Column(sa.DateTime, nullable=False)
 
@@ -19,6 +19,9 @@ class Label(Base):
     color = sa.Column(sa.Text, nullable=False)
     text_color = sa.Column(sa.Text, nullable=False)
 
+    ticket_count = sa.Column(sa.Integer, nullable=False, server_default='0')
+    """Maintained by triggers on the ticket_label table"""
+
     tickets = sa.orm.relationship("Ticket",
             secondary="ticket_label", viewonly=True)
 
@@ -40,6 +43,7 @@ class Label(Base):
             **({
                 "created": self.created,
                 "tracker": self.tracker.to_dict(short=True),
+                "tickets": self.ticket_count,
             } if not short else {})
         }
 
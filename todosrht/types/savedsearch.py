@@ -0,0 +1,55 @@
+import sqlalchemy as sa
+from srht.database import Base
+
+class SavedSearch(Base):
+    """A search on a tracker which a user keeps on their dashboard."""
+    __tablename__ = 'saved_search'
+    __table_args__ = (
+        sa.UniqueConstraint("user_id", "tracker_id", "name",
+            name="uq_saved_search_user_id_tracker_id_name"),
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    created = sa.Column(sa.DateTime, nullable=False)
+    updated = sa.Column(sa.DateTime, nullable=False)
+
+    user_id = sa.Column(sa.Integer,
+            sa.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    user = sa.orm.relationship("User",
+            backref=sa.orm.backref("saved_searches",
+                cascade="all, delete-orphan"))
+
+    tracker_id = sa.Column(sa.Integer,
+            sa.ForeignKey("tracker.id", ondelete="CASCADE"), nullable=False)
+    tracker = sa.orm.relationship("Tracker",
+            backref=sa.orm.backref("saved_searches",
+                cascade="all, delete-orphan"))
+
+    name = sa.Column(sa.Unicode(128), nullable=False)
+    search = sa.Column(sa.Unicode(2048), nullable=False)
+
+    tracker_version = sa.Column(sa.Integer)
+    """
+    The tracker's ticket_version which the results are up to date with, or
+    None if they were never computed
+    """
+
+    tickets = sa.orm.relationship("Ticket",
+            secondary="saved_search_ticket", viewonly=True)
+
+    def __repr__(self):
+        return f"<SavedSearch {self.id} {self.name}>"
+
+class SavedSearchTicket(Base):
+    """A ticket matching a saved search, as of its tracker_version."""
+    __tablename__ = 'saved_search_ticket'
+    __table_args__ = (
+        sa.Index("saved_search_ticket_ticket_id", "ticket_id"),
+    )
+
+    saved_search_id = sa.Column(sa.Integer,
+            sa.ForeignKey("saved_search.id", ondelete="CASCADE"),
+            primary_key=True)
+    ticket_id = sa.Column(sa.Integer,
+            sa.ForeignKey("ticket.id", ondelete="CASCADE"),
+            primary_key=True)
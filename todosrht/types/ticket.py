@@ -10,6 +10,28 @@ class Ticket(Base):
     __table_args__ = (
         sa.UniqueConstraint('tracker_id', 'scoped_id',
             name="uq_ticket_tracker_id_scoped_id"),
+        # Tracker listings filter by tracker and status, and sort by one of
+        # these columns. Most of them only show open tickets.
+        sa.Index("ticket_tracker_id_status_updated",
+            "tracker_id", "status", "updated"),
+        sa.Index("ticket_open_tracker_id_updated", "tracker_id", "updated",
+            postgresql_where=sa.text("status != 8"),
+            sqlite_where=sa.text("status != 8")),
+        sa.Index("ticket_open_tracker_id_created", "tracker_id", "created",
+            postgresql_where=sa.text("status != 8"),
+            sqlite_where=sa.text("status != 8")),
+        sa.Index("ticket_open_tracker_id_comment_count",
+            "tracker_id", "comment_count",
+            postgresql_where=sa.text("status != 8"),
+            sqlite_where=sa.text("status != 8")),
+        # Searches across trackers list the most recently updated open
+        # tickets of any tracker the user can browse
+        sa.Index("ticket_open_updated", "updated",
+            postgresql_where=sa.text("status != 8"),
+            sqlite_where=sa.text("status != 8")),
+        # Search indexes load the tickets written since the version they saw
+        sa.Index("ticket_tracker_id_tracker_version",
+            "tracker_id", "tracker_version"),
     )
     id = sa.Column(sa.Integer, primary_key=True)
     created = sa.Column(sa.DateTime, nullable=False)
@@ -57,6 +79,10 @@ class Ticket(Base):
         foreign_keys="[TicketAssignee.ticket_id,TicketAssignee.assignee_id]",
         viewonly=True)
 
+    tracker_version = sa.Column(sa.Integer,
+            nullable=False, server_default='0')
+    """The tracker's ticket_version as of the last write to this ticket"""
+
     authenticity = sa.Column(
             sau.ChoiceType(TicketAuthenticity, impl=sa.Integer()),
             nullable=False, server_default="0")
@@ -83,20 +109,43 @@ class Ticket(Base):
     def __repr__(self):
         return f"<Ticket {self.id}>"
 
-    def to_dict(self, short=False):
-        return {
-            "id": self.scoped_id,
-            "ref": self.ref(),
-            "tracker": self.tracker.to_dict(short=True),
-            "title": self.title,
+    # Fields of to_dict(), and the relationships each of them loads
+    dict_fields = {
+        "id": [],
+        "ref": ["tracker.owner"],
+        "tracker": ["tracker.owner"],
+        "title": [],
+        "created": [],
+        "updated": [],
+        "submitter": ["submitter.user"],
+        "description": [],
+        "status": [],
+        "resolution": [],
+        "labels": ["labels"],
+        "assignees": ["assigned_users"],
+    }
+
+    def to_dict(self, short=False, fields=None):
+        """
+        If fields is given, only those fields are computed, so that the
+        relationships behind the others are never loaded.
+        """
+        values = {
+            "id": lambda: self.scoped_id,
+            "ref": lambda: self.ref(),
+            "tracker": lambda: self.tracker.to_dict(short=True),
+            "title": lambda: self.title,
             **({
-                "created": self.created,
-                "updated": self.updated,
-                "submitter": self.submitter.to_dict(short=True),
-                "description": self.description,
-                "status": self.status.name,
-                "resolution": self.resolution.name,
-                "labels": [l.name for l in self.labels],
-                "assignees": [u.to_dict(short=True) for u in self.assigned_users],
+                "created": lambda: self.created,
+                "updated": lambda: self.updated,
+                "submitter": lambda: self.submitter.to_dict(short=True),
+                "description": lambda: self.description,
+                "status": lambda: self.status.name,
+                "resolution": lambda: self.resolution.name,
+                "labels": lambda: [l.name for l in self.labels],
+                "assignees": lambda: [u.to_dict(short=True)
+                    for u in self.assigned_users],
             } if not short else {}),
         }
+        return {key: value() for key, value in values.items()
+                if fields is None or key in fields}
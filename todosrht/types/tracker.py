@@ -45,6 +45,28 @@ class Tracker(Base):
     import_in_progress = sa.Column(sa.Boolean,
             nullable=False, server_default='f')
 
+    # Maintained in TrackerTicketStats, which is only created for the tracker
+    # once it is committed
+    @property
+    def ticket_version(self):
+        return self.stats.ticket_version if self.stats else 0
+
+    @property
+    def removed_version(self):
+        return self.stats.removed_version if self.stats else 0
+
+    @property
+    def open_ticket_count(self):
+        return self.stats.open_ticket_count if self.stats else 0
+
+    @property
+    def closed_ticket_count(self):
+        return self.stats.closed_ticket_count if self.stats else 0
+
+    @property
+    def ticket_updated(self):
+        return self.stats.updated if self.stats else None
+
     def ref(self):
         return "{}/{}".format(
             self.owner.canonical_name,
@@ -53,21 +75,81 @@ class Tracker(Base):
     def __repr__(self):
         return '<Tracker {} {}>'.format(self.id, self.name)
 
-    def to_dict(self, short=False):
+    # Fields of to_dict(), and the relationships each of them loads
+    dict_fields = {
+        "id": [],
+        "owner": ["owner"],
+        "created": [],
+        "updated": [],
+        "name": [],
+        "description": [],
+        "default_access": [],
+        "visibility": [],
+        "open_tickets": ["stats"],
+        "closed_tickets": ["stats"],
+    }
+
+    def to_dict(self, short=False, fields=None):
+        """
+        If fields is given, only those fields are computed, so that the
+        relationships behind the others are never loaded.
+        """
         def permissions(w):
             if isinstance(w, int):
                 w = TicketAccess(w)
             return [p.name for p in TicketAccess
                     if p in w and p not in [TicketAccess.none, TicketAccess.all]]
-        return {
-            "id": self.id,
-            "owner": self.owner.to_dict(short=True),
-            "created": self.created,
-            "updated": self.updated,
-            "name": self.name,
+        values = {
+            "id": lambda: self.id,
+            "owner": lambda: self.owner.to_dict(short=True),
+            "created": lambda: self.created,
+            "updated": lambda: self.updated,
+            "name": lambda: self.name,
             **({
-                "description": self.description,
-                "default_access": permissions(self.default_access),
-                "visibility": self.visibility,
+                "description": lambda: self.description,
+                "default_access": lambda: permissions(self.default_access),
+                "visibility": lambda: self.visibility,
+                "open_tickets": lambda: self.open_ticket_count,
+                "closed_tickets": lambda: self.closed_ticket_count,
             } if not short else {})
         }
+        return {key: value() for key, value in values.items()
+                if fields is None or key in fields}
+
+class TrackerTicketStats(Base):
+    """
+    Counters over the tickets of a tracker, maintained by triggers on the
+    ticket table as each transaction commits. They are kept out of the
+    tracker row so that ticket writes do not lock the tracker.
+    """
+    __tablename__ = 'tracker_ticket_stats'
+    tracker_id = sa.Column(sa.Integer,
+            sa.ForeignKey("tracker.id", ondelete="CASCADE"), primary_key=True)
+    tracker = sa.orm.relationship("Tracker",
+            backref=sa.orm.backref("stats", uselist=False,
+                cascade="all, delete-orphan", passive_deletes=True))
+
+    ticket_version = sa.Column(sa.Integer,
+            nullable=False, server_default='0')
+    """
+    Incremented whenever any ticket of the tracker, or its labels or
+    assignees, are written
+    """
+
+    removed_version = sa.Column(sa.Integer,
+            nullable=False, server_default='0')
+    """
+    The ticket_version at which a ticket was last deleted from the tracker or
+    moved to another one
+    """
+
+    open_ticket_count = sa.Column(sa.Integer,
+            nullable=False, server_default='0')
+    closed_ticket_count = sa.Column(sa.Integer,
+            nullable=False, server_default='0')
+
+    updated = sa.Column(sa.DateTime)
+    """Time of the last write to any ticket of the tracker"""
+
+    def __repr__(self):
+        return '<TrackerTicketStats {}>'.format(self.tracker_id)
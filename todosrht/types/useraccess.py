@@ -26,6 +26,7 @@ class UserAccess(Base):
     __table_args__ = (
         sa.UniqueConstraint("tracker_id", "user_id",
             name="idx_useraccess_tracker_user_unique"),
+        sa.Index("user_access_user_id", "user_id"),
     )
 
     def __repr__(self):
@@ -58,18 +58,23 @@ def label_edit_url(label):
         name=label.tracker.name,
         label_name=label.name)
 
-def label_search_url(label, terms=""):
-    """Return the URL to the tracker page listing all tickets which have the
-    label applied."""
-    label_term = f"label:\"{label.name}\""
+def tracker_search_url(tracker, term, terms=""):
+    """Return the URL to the tracker page listing the tickets matching the
+    search terms, narrowed down to those also matching term."""
     if not terms:
-        terms = label_term
-    elif label_term not in terms:
-        terms += " " + label_term
+        terms = term
+    elif term not in terms:
+        terms += " " + term
     return "{}?search={}".format(
-        tracker_url(label.tracker),
+        tracker_url(tracker),
         url_quote(terms))
 
+def label_search_url(label, terms=""):
+    """Return the URL to the tracker page listing all tickets which have the
+    label applied."""
+    return tracker_search_url(label.tracker,
+        f"label:\"{label.name}\"", terms=terms)
+
 def label_add_url(ticket):
     """Return the URL to add a label to a ticket."""
     return url_for("ticket.ticket_add_label",
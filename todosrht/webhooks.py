@@ -5,9 +5,13 @@ if not hasattr(db, "session"):
     db = DbSession(cfg("todo.sr.ht", "connection-string"))
     import todosrht.types
     db.init()
+from datetime import timedelta
+from srht.cache import get_cache, set_cache
 from srht.webhook import Event
 from srht.webhook.celery import CeleryWebhook, make_worker
 from srht.metrics import RedisQueueCollector
+from todosrht.serialize import dumps
+import json
 import sqlalchemy as sa
 
 
@@ -35,6 +39,8 @@ class TrackerWebhook(CeleryWebhook):
             sa.ForeignKey('tracker.id', ondelete="CASCADE"), nullable=False)
     tracker = sa.orm.relationship('Tracker', cascade="all, delete-orphan")
 
+    route_column = "tracker_id"
+
 class TicketWebhook(CeleryWebhook):
     events = [
         Event("ticket:update", "tickets:read"),
@@ -45,3 +51,99 @@ class TicketWebhook(CeleryWebhook):
             sa.ForeignKey('ticket.id', ondelete="CASCADE"), nullable=False)
     ticket = sa.orm.relationship('Ticket', cascade="all, delete-orphan")
 
+    route_column = "ticket_id"
+
+_webhooks = {cls.__name__: cls
+        for cls in [UserWebhook, TrackerWebhook, TicketWebhook]}
+
+# The routing table maps a tracker or ticket to its webhook subscriptions, so
+# that events on trackers and tickets without webhooks need no queries.
+routes_ttl = timedelta(minutes=5)
+
+def _routes_key(cls, route_id):
+    return f"todo.sr.ht:webhook_routes:{cls.__name__}:{route_id}"
+
+def get_routes(cls, route_id):
+    """
+    Returns (subscription ID, URL, event names) for each subscription to a
+    tracker or ticket, as selected by cls.route_column.
+    """
+    key = _routes_key(cls, route_id)
+    routes = get_cache(key)
+    if routes:
+        return json.loads(routes)
+    column = getattr(cls.Subscription, cls.route_column)
+    subs = cls.Subscription.query.filter(column == route_id).all()
+    routes = [(sub.id, sub.url, [event.value for event in sub.events])
+            for sub in subs]
+    set_cache(key, routes_ttl, json.dumps(routes))
+    return routes
+
+_routed_webhooks = {cls.Subscription: cls
+        for cls in [TrackerWebhook, TicketWebhook]}
+
+def _invalidate_routes(mapper, connection, sub):
+    cls = _routed_webhooks[type(sub)]
+    session = sa.orm.object_session(sub)
+    stale = session.info.setdefault("stale_webhook_routes", set())
+    stale.add(_routes_key(cls, getattr(sub, cls.route_column)))
+
+for Subscription in _routed_webhooks:
+    for identifier in ["after_insert", "after_update", "after_delete"]:
+        sa.event.listen(Subscription, identifier, _invalidate_routes)
+
+@sa.event.listens_for(sa.orm.Session, "after_commit")
+def _expire_stale_routes(session):
+    for key in session.info.pop("stale_webhook_routes", set()):
+        # An empty entry is treated as a miss and replaced on the next lookup
+        set_cache(key, routes_ttl, "")
+
+@worker.task
+def deliver_batch(webhook, sub_id, events):
+    """
+    Delivers a batch of webhook events to one subscriber, in order. Each
+    event is recorded, signed and sent by the webhook class itself.
+    """
+    cls = _webhooks[webhook]
+    sub = cls.Subscription.query.get(sub_id)
+    if not sub:
+        # Unsubscribed since the events were raised
+        return
+    for event, payload in events:
+        cls.notify(sub, cls.Events(event), payload, delay=False)
+
+class WebhookBatch:
+    """
+    Collects the webhook events raised while handling a request, to deliver
+    them together once the request's changes are committed.
+
+    Subscriptions are looked up once per tracker or ticket, through the
+    routing table, and each subscriber receives a single task carrying every
+    event it subscribes to, in the order the events were added.
+
+    Payloads may be given as JSON bytes, e.g. from serialize(), to share them
+    with the response.
+    """
+    def __init__(self):
+        self.events = dict()
+
+    def add(self, cls, event, payload, route_id):
+        """
+        Adds an event for the subscribers of the tracker or ticket with the
+        given ID, as selected by cls.route_column.
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        else:
+            payload = dumps(payload).decode()
+        self.events.setdefault((cls, route_id), list()).append((event, payload))
+
+    def deliver(self):
+        """Delivers all collected events. Call after committing."""
+        for (cls, route_id), events in self.events.items():
+            for sub_id, url, sub_events in get_routes(cls, route_id):
+                batch = [(event.value, payload)
+                    for event, payload in events if event.value in sub_events]
+                if batch:
+                    deliver_batch.delay(cls.__name__, sub_id, batch)
+        self.events = dict()